@@ -0,0 +1,85 @@
+# bench/bench_compression.py
+"""
+Bandwidth vs CPU for compressing a sync pull response: compressed size,
+compress/decompress time per level, and the resulting transfer time on
+a slow branch-office link. Brotli rows appear when `brotli` is installed.
+
+    python bench/bench_compression.py [rows] [link_mbit]
+"""
+
+import sys
+import json
+import time
+import zlib
+import random
+import datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def sample_pull(rows: int) -> bytes:
+    # same shape as /sync/sync/pull: repetitive column names, varied values
+    rnd = random.Random(42)
+    start = datetime.datetime(2024, 1, 1)
+    out = []
+    for i in range(rows):
+        out.append({
+            "remote_id": i + 1,
+            "data": {
+                "agent_code": f"P{rnd.randrange(200)}",
+                "name": f"Customer {rnd.randrange(10 ** 6)}",
+                "pan": "ABCDE%04dF" % rnd.randrange(10000),
+                "mobile": "98%08d" % rnd.randrange(10 ** 8),
+                "handled_by": f"agent_{rnd.randrange(50)}",
+                "created_at": (start + datetime.timedelta(seconds=i * 37)).isoformat(),
+                "remote_token": "%032x" % rnd.getrandbits(128),
+            },
+        })
+    return json.dumps({"pan_records": out}, separators=(",", ":")).encode()
+
+
+def _time(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    link_mbit = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    raw = sample_pull(rows)
+    link_bytes_s = link_mbit * 1_000_000 / 8
+
+    cases = [("identity", None, lambda b: b, lambda b: b)]
+    for level in (1, 4, 6, 9):
+        cases.append((
+            "gzip", level,
+            lambda b, lv=level: zlib.compress(b, lv, wbits=31),
+            lambda b: zlib.decompress(b, wbits=31),
+        ))
+    if brotli is not None:
+        for quality in (1, 4, 6, 11):
+            cases.append(("br", quality, lambda b, q=quality: brotli.compress(b, quality=q), brotli.decompress))
+
+    print(f"{rows} rows, {len(raw) / 1024:.0f} KiB raw, link {link_mbit} Mbit/s")
+    print(f"{'encoding':<9} {'level':>5} {'size KiB':>9} {'ratio':>6} {'comp ms':>8} {'decomp ms':>9} {'transfer ms':>11} {'total ms':>9}")
+    for name, level, comp, decomp in cases:
+        packed = comp(raw)
+        c = _time(lambda: comp(raw))
+        d = _time(lambda: decomp(packed))
+        transfer = len(packed) / link_bytes_s
+        print(f"{name:<9} {level if level is not None else '-':>5} {len(packed) / 1024:>9.1f} "
+              f"{len(raw) / len(packed):>6.1f} {c * 1000:>8.1f} {d * 1000:>9.1f} "
+              f"{transfer * 1000:>11.0f} {(c + d + transfer) * 1000:>9.0f}")
+    if brotli is None:
+        print("(brotli not installed; pip install brotli to compare)")
+
+
+if __name__ == "__main__":
+    main()
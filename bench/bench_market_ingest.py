@@ -0,0 +1,113 @@
+# bench/bench_market_ingest.py
+"""
+Market price ingestion: the bulk COPY path vs row-by-row INSERTs, and
+latest-price lookups from the cache vs a query per lookup.
+
+Needs a database initialised with init_db (DATABASE_URL). Generates
+`rows` daily prices for `symbols` symbols (several months at the
+defaults), loads them both ways and cleans up its symbols afterwards.
+
+    python bench/bench_market_ingest.py [rows] [symbols]
+"""
+
+import os
+import sys
+import time
+import random
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import db, market_data  # noqa: E402
+
+PREFIX = "BENCH"
+
+
+def make_csv(rows: int, symbols: int) -> bytes:
+    start = datetime.datetime(2026, 1, 1)
+    lines = ["symbol,price,volume,ts"]
+    for i in range(rows):
+        ts = start + datetime.timedelta(days=i // symbols)  # one price per symbol per day
+        lines.append(f"{PREFIX}{i % symbols},{random.uniform(10, 500):.4f},{random.randint(0, 10 ** 6)},{ts:%Y-%m-%d %H:%M:%S}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def cleanup():
+    conn = db.get_conn(); cur = conn.cursor()
+    cur.execute("DELETE FROM market_prices WHERE symbol LIKE %s", (PREFIX + "%",))
+    cur.execute("DELETE FROM market_latest WHERE symbol LIKE %s", (PREFIX + "%",))
+    conn.commit()
+    cur.close(); conn.close()
+    market_data.invalidate()
+
+
+def bulk(raw: bytes) -> float:
+    t = time.perf_counter()
+    stage, months, received, errors = market_data.parse_batch(raw, "csv")
+    market_data.ensure_partitions(months)
+    counts = market_data.load_batch(stage, "bench")
+    elapsed = time.perf_counter() - t
+    print(f"bulk:       {received} rows in {elapsed:.2f}s ({received / elapsed:,.0f} rows/s) {counts}")
+    return elapsed
+
+
+def row_by_row(raw: bytes) -> float:
+    stage, _, received, _ = market_data.parse_batch(raw, "csv")
+    rows = [line.split(",") for line in stage.getvalue().splitlines()]
+    conn = db.get_conn(); cur = conn.cursor()
+    t = time.perf_counter()
+    for _, symbol, price, volume, ts in rows:
+        cur.execute(
+            "INSERT INTO market_prices (symbol, price, volume, ts, source) VALUES (%s, %s, %s, %s, 'bench')"
+            " ON CONFLICT (symbol, ts) DO UPDATE SET price = excluded.price, volume = excluded.volume",
+            (symbol, price, volume or None, ts),
+        )
+        cur.execute(
+            "INSERT INTO market_latest AS l (symbol, price, volume, ts) VALUES (%s, %s, %s, %s)"
+            " ON CONFLICT (symbol) DO UPDATE SET price = excluded.price, volume = excluded.volume, ts = excluded.ts"
+            " WHERE excluded.ts >= l.ts",
+            (symbol, price, volume or None, ts),
+        )
+    conn.commit()
+    elapsed = time.perf_counter() - t
+    cur.close(); conn.close()
+    print(f"row by row: {received} rows in {elapsed:.2f}s ({received / elapsed:,.0f} rows/s)")
+    return elapsed
+
+
+def lookups(symbols: int, n: int = 20000):
+    names = [f"{PREFIX}{random.randrange(symbols)}" for _ in range(n)]
+    market_data.get_latest(names[0])  # load the cache
+    t = time.perf_counter()
+    for s in names:
+        market_data.get_latest(s)
+    cached = time.perf_counter() - t
+
+    conn = db.get_conn(); cur = conn.cursor()
+    t = time.perf_counter()
+    for s in names[:2000]:
+        cur.execute("SELECT symbol, price, volume, ts FROM market_latest WHERE symbol = %s", (s,))
+        cur.fetchone()
+    queried = (time.perf_counter() - t) / 2000 * n
+    cur.close(); conn.close()
+    print(f"lookups:    cache {cached / n * 1e6:.2f} us/lookup, query {queried / n * 1e6:.1f} us/lookup")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    symbols = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    raw = make_csv(rows, symbols)
+    db.init_pool()
+    try:
+        cleanup()
+        bulk(raw)
+        lookups(symbols)
+        cleanup()
+        row_by_row(raw[: raw.index(b"\n", len(raw) // 10)])  # a tenth is plenty to compare rates
+        cleanup()
+    finally:
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# bench/bench_startup.py
+"""
+Startup cost of the API:
+- import time of server.main in a fresh interpreter (no DB access expected)
+- time from spawning uvicorn to the first successful GET /
+
+Needs DATABASE_URL pointing at a reachable Postgres (lifespan runs init_db).
+
+    python bench/bench_startup.py [runs] [port]
+"""
+
+import os
+import sys
+import time
+import socket
+import statistics
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import server.main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def measure_import() -> float:
+    out = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT)
+    return float(out.decode().strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_request(port: int, timeout: float = 60.0) -> float:
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("server did not answer in time")
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    imports = [measure_import() for _ in range(runs)]
+    firsts = [measure_first_request(port or _free_port()) for _ in range(runs)]
+
+    print(f"import server.main     median {statistics.median(imports) * 1000:8.1f} ms  (min {min(imports) * 1000:.1f})")
+    print(f"spawn -> first request median {statistics.median(firsts) * 1000:8.1f} ms  (min {min(firsts) * 1000:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# bench/bench_templates.py
+"""
+Renders/second for OTP messages: precompiled template vs re-parsing the
+stored text on every send.
+
+    python bench/bench_templates.py [iterations]
+"""
+
+import os
+import sys
+import time
+import string
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.template_engine import compile_template, DEFAULT_OTP_TEMPLATE_EN, OTP_PLACEHOLDERS  # noqa: E402
+
+
+def _rate(label, fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {n / elapsed:>12,.0f} renders/s  ({elapsed * 1e6 / n:.2f} us/render)")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    values = {"username": "ramesh", "otp": "482913", "minutes": 10}
+    compiled = compile_template(DEFAULT_OTP_TEMPLATE_EN, "otp_template_whatsapp_en", allowed=OTP_PLACEHOLDERS, required=("otp",))
+    formatter = string.Formatter()
+
+    def reparse(_):
+        # what every consumer would do without the engine: parse + validate + render
+        for _, field, _, _ in formatter.parse(DEFAULT_OTP_TEMPLATE_EN):
+            if field is not None and field not in OTP_PLACEHOLDERS:
+                raise ValueError(field)
+        return DEFAULT_OTP_TEMPLATE_EN.format_map(values)
+
+    def compile_each_time(_):
+        return compile_template(DEFAULT_OTP_TEMPLATE_EN, allowed=OTP_PLACEHOLDERS).render(values)
+
+    _rate("precompiled renderer", lambda _: compiled.render(values), n)
+    _rate("parse + validate per render", reparse, n)
+    _rate("compile per render", compile_each_time, n)
+
+
+if __name__ == "__main__":
+    main()
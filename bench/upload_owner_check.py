@@ -0,0 +1,63 @@
+# bench/upload_owner_check.py
+"""
+Check that upload sessions are private to the user who started them,
+against a running server:
+
+    BASE_URL=http://localhost:8000 JWT_SECRET=... python bench/upload_owner_check.py
+
+Mints tokens for two users the way auth_router does (sub, role,
+user_id), starts a session as the first and expects the second to get
+403 on status, chunk upload and complete. Exits 1 on any failure.
+"""
+
+import os
+import sys
+import time
+import hashlib
+
+import requests
+from jose import jwt
+
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000").rstrip("/")
+JWT_SECRET = os.environ.get("JWT_SECRET", "loadtest-secret")
+
+
+def _auth(sub: str, user_id: int) -> dict:
+    now = int(time.time())
+    token = jwt.encode(
+        {"sub": sub, "role": "USER", "user_id": user_id, "iat": now, "exp": now + 600},
+        JWT_SECRET,
+        algorithm="HS256",
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def main():
+    owner, other = _auth("owner_check_a", 900001), _auth("owner_check_b", 900002)
+    data = b"upload owner check\n" * 64
+    r = requests.post(f"{BASE_URL}/uploads/sessions", headers=owner, json={
+        "filename": "owner_check.txt",
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    })
+    r.raise_for_status()
+    url = f"{BASE_URL}/uploads/sessions/{r.json()['session_id']}"
+
+    checks = [
+        ("other: status", requests.get(url, headers=other), 403),
+        ("other: chunk", requests.put(url, params={"offset": 0}, data=data, headers={
+            **other, "X-Chunk-SHA256": hashlib.sha256(data).hexdigest(),
+        }), 403),
+        ("other: complete", requests.post(f"{url}/complete", headers=other), 403),
+        ("owner: status", requests.get(url, headers=owner), 200),
+    ]
+    failed = 0
+    for name, resp, expected in checks:
+        ok = resp.status_code == expected
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {resp.status_code} (expected {expected})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,205 @@
-# admin_router.py
-from fastapi import APIRouter, Depends, Request, HTTPException
-from db import get_conn
-import json
-import datetime
-
-router = APIRouter()
-
-def log_admin_action(actor_username: str, action: str, target: str = '', details: str = '', ip: str = None):
-    try:
-        conn = get_conn(); cur = conn.cursor()
-        now = datetime.datetime.utcnow().isoformat()
-        cur.execute("INSERT INTO admin_audit(actor_username, action, target, details, ip_address, created_at) VALUES (?,?,?,?,?,?)",
-                    (actor_username, action, target, details or '', ip or 'unknown', now))
-        conn.commit(); conn.close()
-    except Exception as e:
-        print("audit log failed:", e)
-
-@router.get("/admin/users")
-def list_users(current_user: Dict = Depends(lambda: None)):
-    # current_user enforced at mount
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT id,username,full_name,role,partner_code,email,created_at,last_login FROM users ORDER BY id")
-    rows = cur.fetchall(); conn.close()
-    return [dict(r) for r in rows]
-
-@router.post("/admin/create_user")
-def create_user(payload: Dict = None, request: Request=None, current_user: Dict = Depends(lambda: None)):
-    data = payload or {}
-    username = data.get('username'); password = data.get('password'); role = data.get('role','AGENT')
-    if not username or not password:
-        raise HTTPException(400, "username & password required")
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("INSERT INTO users(username,password_hash,full_name,role,created_at) VALUES(?,?,?,?,?)",
-                (username, payload.get('password_hash') or payload.get('password'), username, role, datetime.datetime.utcnow().isoformat()))
-    conn.commit(); conn.close()
-    try:
-        log_admin_action(current_user['username'], 'create_user', username, details=json.dumps({'role': role}), ip=(request.client.host if request else None))
-    except:
-        pass
-    return {"status":"ok"}
+# admin_router.py
+from fastapi import APIRouter, Depends, Request, HTTPException
+from typing import Dict, Optional
+from .db import get_conn, USER_SEARCH_EXPR, replica_status
+from .dependencies import get_current_user
+from . import audit, background
+from .fastjson import ORJSONResponse
+from .utils import hash_password
+import json
+import datetime
+
+router = APIRouter()
+
+USER_LIST_COLUMNS = "id,username,full_name,role,partner_code,email,created_at,last_login"
+USER_SORT_COLUMNS = ("id", "username", "full_name", "role", "partner_code", "email", "created_at", "last_login")
+USER_PAGE_MAX = 200
+
+
+def _estimate_rows(cur, where_sql: str, args: list) -> int:
+    """
+    Planner row estimate instead of COUNT(*): pg_class.reltuples when
+    unfiltered, EXPLAIN's top-level row count otherwise.
+    """
+    if not where_sql:
+        cur.execute("SELECT reltuples::bigint AS n FROM pg_class WHERE oid = 'users'::regclass")
+        n = cur.fetchone()["n"]
+        if n is not None and n >= 0:
+            return int(n)
+        # never analyzed (reltuples = -1): the table is new and small, count it
+        cur.execute("SELECT COUNT(*) AS n FROM users")
+        return int(cur.fetchone()["n"])
+    cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM users {where_sql}", args)
+    plan = list(cur.fetchone().values())[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+@router.get("/admin/users")
+def list_users(
+    page: int = 1,
+    page_size: int = 50,
+    sort: str = "id",
+    order: str = "asc",
+    role: Optional[str] = None,
+    partner_code: Optional[str] = None,
+    q: Optional[str] = None,
+    current_user: Dict = Depends(lambda: None),
+):
+    """
+    Paginated user list. `q` is a case-insensitive substring match on
+    username, full_name and email (pg_trgm index). total_estimate is the
+    planner's estimate, not an exact count.
+    """
+    # current_user enforced at mount
+    if sort not in USER_SORT_COLUMNS:
+        raise HTTPException(400, f"sort must be one of: {', '.join(USER_SORT_COLUMNS)}")
+    direction = "DESC" if order.lower() == "desc" else "ASC"
+    page = max(page, 1)
+    page_size = max(1, min(page_size, USER_PAGE_MAX))
+
+    where, args = [], []
+    if role:
+        where.append("role = %s"); args.append(role)
+    if partner_code:
+        where.append("partner_code = %s"); args.append(partner_code)
+    if q:
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append(f"{USER_SEARCH_EXPR} ILIKE %s"); args.append(f"%{escaped}%")
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+
+    conn = get_conn(readonly=True); cur = conn.cursor()
+    try:
+        cur.execute(
+            f"SELECT {USER_LIST_COLUMNS} FROM users {where_sql} ORDER BY {sort} {direction} NULLS LAST, id {direction} LIMIT %s OFFSET %s",
+            args + [page_size, (page - 1) * page_size],
+        )
+        rows = cur.fetchall()
+        total = _estimate_rows(cur, where_sql, args)
+    finally:
+        cur.close(); conn.close()
+    # an estimate can undershoot what we can already see
+    total = max(total, (page - 1) * page_size + len(rows))
+    return ORJSONResponse({
+        "items": rows,
+        "page": page,
+        "page_size": page_size,
+        "total_estimate": total,
+        "total_is_estimate": True,
+    })
+
+@router.post("/admin/create_user")
+def create_user(payload: Dict = None, request: Request=None, current_user: Dict = Depends(get_current_user)):
+    data = payload or {}
+    username = data.get('username'); password = data.get('password'); role = data.get('role','AGENT')
+    if not username or not password:
+        raise HTTPException(400, "username & password required")
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+        if cur.fetchone():
+            raise HTTPException(409, "Username already exists")
+        cur.execute(
+            "INSERT INTO users(username,password_hash,full_name,role,created_at) VALUES(%s,%s,%s,%s,%s)",
+            (username, hash_password(password), data.get('full_name') or username, role, datetime.datetime.utcnow()),
+        )
+        conn.commit()
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(500, f"Database error: {e}")
+    finally:
+        cur.close(); conn.close()
+    audit.log_admin_action(current_user, request, 'create_user', username, {'role': role})
+    return {"status":"ok"}
+
+USER_EDITABLE_FIELDS = ("full_name", "email", "partner_code")
+
+
+def _update_user(username: str, changes: Dict) -> Dict:
+    """
+    Apply column changes to one user; returns the previous values of the
+    changed columns. 404 if the user does not exist.
+    """
+    cols = list(changes)
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT id, {', '.join(cols)} FROM users WHERE username = %s FOR UPDATE", (username,))
+        before = cur.fetchone()
+        if not before:
+            raise HTTPException(404, "User not found")
+        cur.execute(
+            f"UPDATE users SET {', '.join(f'{c} = %s' for c in cols)} WHERE id = %s",
+            [changes[c] for c in cols] + [before["id"]],
+        )
+        conn.commit()
+        return {c: before[c] for c in cols}
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(500, f"Database error: {e}")
+    finally:
+        cur.close(); conn.close()
+
+
+@router.post("/admin/set_user_role")
+def set_user_role(payload: Dict = None, request: Request=None, current_user: Dict = Depends(get_current_user)):
+    data = payload or {}
+    username = data.get('username'); role = (data.get('role') or '').strip()
+    if not username or not role:
+        raise HTTPException(400, "username & role required")
+    before = _update_user(username, {'role': role})
+    audit.log_admin_action(current_user, request, 'set_user_role', username, {'from': before['role'], 'to': role})
+    return {"status":"ok", "username": username, "role": role}
+
+
+@router.post("/admin/update_user")
+def update_user(payload: Dict = None, request: Request=None, current_user: Dict = Depends(get_current_user)):
+    """
+    Change full_name / email / partner_code and, with `password`, reset
+    the password. Only the names of changed fields are audited, never
+    the password.
+    """
+    data = dict(payload or {})
+    username = data.pop('username', None)
+    if not username:
+        raise HTTPException(400, "username required")
+    unknown = [k for k in data if k not in USER_EDITABLE_FIELDS + ('password',)]
+    if unknown:
+        raise HTTPException(400, f"Cannot change: {', '.join(unknown)}")
+    changes = {k: data[k] for k in USER_EDITABLE_FIELDS if k in data}
+    if data.get('password'):
+        changes['password_hash'] = hash_password(data['password'])
+    if not changes:
+        raise HTTPException(400, "nothing to change")
+    before = _update_user(username, changes)
+    details = {k: {'from': before[k], 'to': changes[k]} for k in changes if k != 'password_hash'}
+    if 'password_hash' in changes:
+        details['password'] = 'reset'
+    audit.log_admin_action(current_user, request, 'update_user', username, details)
+    return {"status":"ok", "username": username, "changed": sorted(details)}
+
+@router.get("/admin/audit/status")
+def audit_status(current_user: Dict = Depends(lambda: None)):
+    return {
+        "queue_depth": audit.queue_depth(),
+        "spool_bytes": audit.spool_bytes(),
+        **audit.stats,
+    }
+
+@router.get("/admin/jobs")
+def scheduled_jobs(current_user: Dict = Depends(lambda: None)):
+    return ORJSONResponse({
+        "runner": background.RUNNER_ID,
+        "is_leader": background.is_leader(),
+        "jobs": background.job_runs(),
+    })
+
+@router.get("/admin/db/replicas")
+def db_replicas(current_user: Dict = Depends(lambda: None)):
+    return {"replicas": replica_status()}
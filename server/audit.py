@@ -0,0 +1,270 @@
+# audit.py
+"""
+Asynchronous, batched admin audit log.
+
+log_event() only enqueues. A writer thread inserts queued events into
+admin_audit in batches. If the database is unavailable the batch is
+appended to a JSONL spool file, which is replayed after the next
+successful write. Spool lines that cannot be parsed (e.g. cut short by a
+crash mid-append) are moved to a `.bad` file instead of blocking the
+replay. stop() drains the queue before returning and is also
+registered with atexit, so events are flushed on shutdown.
+"""
+
+import os
+import json
+import queue
+import atexit
+import datetime
+import threading
+
+from psycopg2.extras import execute_values
+
+from .db import get_conn
+
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_SECONDS = float(os.environ.get("AUDIT_FLUSH_SECONDS", "1.0"))
+AUDIT_QUEUE_MAX = int(os.environ.get("AUDIT_QUEUE_MAX", "10000"))
+AUDIT_SPOOL_FILE = os.environ.get(
+    "AUDIT_SPOOL_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit_spool.jsonl")
+)
+
+_queue = queue.Queue(maxsize=AUDIT_QUEUE_MAX)
+_stop = threading.Event()
+_spool_lock = threading.Lock()
+_replay_lock = threading.Lock()
+_thread = None
+stats = {"written": 0, "spooled": 0, "replayed": 0, "failed_batches": 0, "quarantined": 0}
+
+# per-process, so workers sharing the spool never replay the same events
+_REPLAY_FILE = f"{AUDIT_SPOOL_FILE}.{os.getpid()}.replay"
+_BAD_FILE = f"{AUDIT_SPOOL_FILE}.bad"
+_COLUMNS = ("actor_username", "action", "target", "details", "ip_address", "created_at")
+
+
+def log_event(actor_username: str, action: str, target: str = "", details: str = "", ip: str = None):
+    """
+    Queue one audit event; never blocks the request and never raises.
+    """
+    event = {
+        "actor_username": actor_username,
+        "action": action,
+        "target": target or "",
+        "details": details or "",
+        "ip_address": ip or "unknown",
+        "created_at": datetime.datetime.utcnow().isoformat(),
+    }
+    try:
+        _queue.put_nowait(event)
+    except queue.Full:
+        # writer is far behind; keep the event on disk rather than drop it
+        _spool([event])
+
+
+def log_admin_action(current_user, request, action: str, target: str = "", details=None):
+    """
+    log_event() for an admin request: actor from the token subject,
+    client IP from the request, dict details as JSON.
+    """
+    user = current_user or {}
+    actor = user.get("sub") or user.get("username") or "unknown"
+    ip = request.client.host if request is not None and request.client else None
+    if details is not None and not isinstance(details, str):
+        details = json.dumps(details, default=str)
+    log_event(actor, action, target, details or "", ip)
+
+
+def queue_depth() -> int:
+    return _queue.qsize()
+
+
+def spool_bytes() -> int:
+    try:
+        return os.path.getsize(AUDIT_SPOOL_FILE)
+    except OSError:
+        return 0
+
+
+def _insert(events):
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        execute_values(
+            cur,
+            f"INSERT INTO admin_audit ({', '.join(_COLUMNS)}) VALUES %s",
+            [tuple(e[c] for c in _COLUMNS) for e in events],
+            page_size=AUDIT_BATCH_SIZE,
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close(); conn.close()
+
+
+def _spool(events):
+    data = "".join(json.dumps(e) + "\n" for e in events).encode("utf-8")
+    with _spool_lock:
+        with open(AUDIT_SPOOL_FILE, "a+b") as f:
+            # a line cut short by a crash must not swallow the next event
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+    stats["spooled"] += len(events)
+
+
+def _read_replay_file() -> list:
+    """
+    Parse the replay file line by line; lines that are not a complete
+    event are appended to the .bad file.
+    """
+    events, bad = [], []
+    with open(_REPLAY_FILE, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                if not isinstance(event, dict) or any(c not in event for c in _COLUMNS):
+                    raise ValueError("not an audit event")
+            except ValueError:
+                bad.append(line if line.endswith("\n") else line + "\n")
+                continue
+            events.append(event)
+    if bad:
+        with open(_BAD_FILE, "a", encoding="utf-8") as f:
+            f.writelines(bad)
+        stats["quarantined"] += len(bad)
+        print(f"audit spool: moved {len(bad)} unreadable line(s) to {_BAD_FILE}")
+    return events
+
+
+def _replay_spool():
+    """
+    Move the spool aside and insert it in batches; whatever fails goes
+    back into a fresh spool. The rename is atomic, so with several
+    workers only one of them takes any given spool.
+    """
+    if not _replay_lock.acquire(blocking=False):
+        return
+    try:
+        with _spool_lock:
+            if not os.path.exists(_REPLAY_FILE):
+                if not os.path.exists(AUDIT_SPOOL_FILE):
+                    return
+                os.replace(AUDIT_SPOOL_FILE, _REPLAY_FILE)
+        events = _read_replay_file()
+        for i in range(0, len(events), AUDIT_BATCH_SIZE):
+            batch = events[i:i + AUDIT_BATCH_SIZE]
+            try:
+                _insert(batch)
+                stats["replayed"] += len(batch)
+            except Exception as e:
+                print("audit spool replay failed:", e)
+                _spool(events[i:])
+                break
+        os.remove(_REPLAY_FILE)
+    finally:
+        _replay_lock.release()
+
+
+def _write(events):
+    try:
+        _insert(events)
+        stats["written"] += len(events)
+    except Exception as e:
+        stats["failed_batches"] += 1
+        print("audit batch write failed, spooling:", e)
+        _spool(events)
+        return
+    if spool_bytes():
+        try:
+            _replay_spool()
+        except Exception as e:
+            # the spool stays on disk for the next attempt; the writer must keep running
+            print("audit spool replay error:", e)
+
+
+def _drain(block_seconds: float):
+    batch = []
+    try:
+        batch.append(_queue.get(timeout=block_seconds))
+        while len(batch) < AUDIT_BATCH_SIZE:
+            batch.append(_queue.get_nowait())
+    except queue.Empty:
+        pass
+    if batch:
+        _write(batch)
+    return len(batch)
+
+
+def _run():
+    while not _stop.is_set():
+        try:
+            _drain(AUDIT_FLUSH_SECONDS)
+        except Exception as e:
+            # e.g. the spool file is not writable; keep serving the queue
+            print("audit writer error:", e)
+    # final flush
+    while True:
+        try:
+            if not _drain(0):
+                break
+        except Exception as e:
+            print("audit writer error:", e)
+
+
+def _adopt_orphaned_replays():
+    """
+    Fold .replay files of processes that died mid-replay back into the spool.
+    """
+    folder = os.path.dirname(AUDIT_SPOOL_FILE) or "."
+    prefix = os.path.basename(AUDIT_SPOOL_FILE) + "."
+    for name in os.listdir(folder):
+        if not (name.startswith(prefix) and name.endswith(".replay")):
+            continue
+        try:
+            pid = int(name[len(prefix):-len(".replay")])
+            os.kill(pid, 0)
+            continue  # owner still running
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue
+        path = os.path.join(folder, name)
+        with _spool_lock:
+            with open(path, encoding="utf-8") as src, open(AUDIT_SPOOL_FILE, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(path)
+
+
+def start():
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="audit-writer", daemon=True)
+    _thread.start()
+    _adopt_orphaned_replays()
+    # events spooled by a previous process that died with the DB down
+    if spool_bytes() or os.path.exists(_REPLAY_FILE):
+        threading.Thread(target=_replay_spool, name="audit-replay", daemon=True).start()
+
+
+def stop(timeout: float = 10.0):
+    """
+    Flush queued events and stop the writer.
+    """
+    _stop.set()
+    if _thread and _thread.is_alive():
+        _thread.join(timeout)
+    # no writer (never started or timed out): write what is left here
+    while _drain(0):
+        pass
+
+
+atexit.register(stop)
@@ -0,0 +1,179 @@
+# background.py
+"""
+In-process periodic job scheduler with leader election.
+
+Each registered job runs on its own daemon thread every `interval`
+seconds. Maintenance jobs (leader_only=True) run only in the worker that
+holds the scheduler's Postgres advisory lock, so several workers or
+instances never run the same cleanup concurrently. The lock is held on a
+dedicated connection; if that worker dies the lock is released with its
+connection and another worker takes over on its next attempt. Jobs that
+maintain per-worker state (leader_only=False) run everywhere.
+
+Every run is recorded in scheduled_job_runs (last start, duration, rows
+affected, status).
+"""
+
+import os
+import time
+import socket
+import datetime
+import threading
+
+from .db import connect, get_conn
+
+SCHEDULER_LOCK_KEY = int(os.environ.get("SCHEDULER_LOCK_KEY", "734512001"))
+LEADER_RETRY_SECONDS = float(os.environ.get("SCHEDULER_LEADER_RETRY_SECONDS", "15"))
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_jobs = {}
+_stop = threading.Event()
+_leader = threading.Event()
+_leader_thread = None
+
+
+def register_job(name: str, interval: float, fn, leader_only: bool = True):
+    """
+    Register fn() to run every `interval` seconds once start_jobs() is called.
+    fn may return rows affected as an int, a dict with "rows", or a list
+    of what it removed. leader_only=False runs it in every worker.
+    """
+    _jobs[name] = {"interval": interval, "fn": fn, "leader_only": leader_only, "thread": None}
+
+
+def is_leader() -> bool:
+    return _leader.is_set()
+
+
+# ---- LEADER ELECTION ----
+def _elect():
+    """
+    Hold pg_try_advisory_lock on a dedicated connection while this
+    worker is leader; keep retrying otherwise.
+    """
+    conn = None
+    while not _stop.is_set():
+        try:
+            if conn is None or conn.closed:
+                _leader.clear()
+                conn = connect()
+                conn.autocommit = True
+            cur = conn.cursor()
+            try:
+                if _leader.is_set():
+                    cur.execute("SELECT 1")  # connection (and so the lock) still alive
+                else:
+                    cur.execute("SELECT pg_try_advisory_lock(%s) AS locked", (SCHEDULER_LOCK_KEY,))
+                    if cur.fetchone()["locked"]:
+                        _leader.set()
+                        print(f"[scheduler] {RUNNER_ID} is now the job leader")
+            finally:
+                cur.close()
+        except Exception as e:
+            if _leader.is_set():
+                print("[scheduler] lost leadership:", e)
+            _leader.clear()
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            conn = None
+        _stop.wait(LEADER_RETRY_SECONDS)
+    _leader.clear()
+    if conn is not None:
+        try:
+            conn.close()  # releases the advisory lock
+        except Exception:
+            pass
+
+
+# ---- RUN RECORDS ----
+def _rows_affected(result):
+    if isinstance(result, bool):
+        return None
+    if isinstance(result, int):
+        return result
+    if isinstance(result, dict):
+        rows = result.get("rows")
+        return rows if isinstance(rows, int) else None
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+def _record_run(name: str, started_at, duration: float, rows, error: str = None):
+    try:
+        conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                INSERT INTO scheduled_job_runs AS r
+                    (job_name, last_started_at, last_duration_ms, last_rows, last_status, last_error, runner, run_count)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 1)
+                ON CONFLICT (job_name) DO UPDATE SET
+                    last_started_at = excluded.last_started_at,
+                    last_duration_ms = excluded.last_duration_ms,
+                    last_rows = excluded.last_rows,
+                    last_status = excluded.last_status,
+                    last_error = excluded.last_error,
+                    runner = excluded.runner,
+                    run_count = r.run_count + 1
+                """,
+                (name, started_at, int(duration * 1000), rows, "error" if error else "ok", error, RUNNER_ID),
+            )
+            conn.commit()
+        finally:
+            cur.close(); conn.close()
+    except Exception as e:
+        print(f"[job] {name}: could not record run:", e)
+
+
+def job_runs() -> list:
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("SELECT * FROM scheduled_job_runs ORDER BY job_name")
+        return cur.fetchall()
+    finally:
+        cur.close(); conn.close()
+
+
+# ---- JOB LOOP ----
+def _loop(name: str, job: dict):
+    while not _stop.wait(job["interval"]):
+        if job["leader_only"] and not _leader.is_set():
+            continue
+        started_at = datetime.datetime.utcnow()
+        started = time.monotonic()
+        try:
+            result = job["fn"]()
+        except Exception as e:
+            print(f"[job] {name} failed:", e)
+            if job["leader_only"]:
+                _record_run(name, started_at, time.monotonic() - started, None, str(e).strip()[:500])
+            continue
+        duration = time.monotonic() - started
+        rows = _rows_affected(result)
+        if job["leader_only"]:
+            print(f"[job] {name} done in {duration:.2f}s: {result}")
+            _record_run(name, started_at, duration, rows)
+
+
+def start_jobs():
+    global _leader_thread
+    _stop.clear()
+    if any(j["leader_only"] for j in _jobs.values()) and not (_leader_thread and _leader_thread.is_alive()):
+        _leader_thread = threading.Thread(target=_elect, name="job-leader", daemon=True)
+        _leader_thread.start()
+    for name, job in _jobs.items():
+        if job["thread"] and job["thread"].is_alive():
+            continue
+        t = threading.Thread(target=_loop, args=(name, job), name=f"job-{name}", daemon=True)
+        job["thread"] = t
+        t.start()
+
+
+def stop_jobs():
+    _stop.set()
+    if _leader_thread and _leader_thread.is_alive():
+        _leader_thread.join(5)
@@ -0,0 +1,199 @@
+# compression.py
+"""
+Negotiated response compression and gzip request bodies.
+
+Responses: JSON/text/msgpack bodies of at least COMPRESS_MIN_BYTES are
+compressed with brotli when the client accepts it and the `brotli`
+package is installed, otherwise with gzip. Streaming responses (sync
+pull) are compressed chunk by chunk. File downloads (Accept-Ranges) are
+never touched, so range requests and sendfile keep working.
+
+Requests: `Content-Encoding: gzip` is accepted on DECOMPRESS_PATHS only
+and is inflated incrementally. More than REQUEST_MAX_DECOMPRESSED_MB
+after inflation returns 413, so a small zip bomb cannot exhaust memory;
+a body that ends before the gzip trailer returns 400.
+"""
+
+import os
+import zlib
+
+from starlette.exceptions import HTTPException
+from starlette.responses import PlainTextResponse
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+REQUEST_MAX_DECOMPRESSED_MB = int(os.environ.get("REQUEST_MAX_DECOMPRESSED_MB", "50"))
+
+# endpoints that accept gzip request bodies
+DECOMPRESS_PATHS = {
+    "/sync/sync/push",
+    "/partners/partners/bulk_upsert",
+    "/market/ingest",
+}
+
+# text/event-stream is excluded: compressor buffering would hold back SSE events
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/x-ndjson", "application/msgpack", "application/x-msgpack")
+
+
+def _accepted(accept_encoding: str) -> set:
+    out = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            out.add(name.strip())
+    return out
+
+
+def choose_encoding(accept_encoding: str):
+    accepted = _accepted(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._finish = self._c.finish
+            self._add = self._c.process
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+            self._finish = self._c.flush
+            self._add = self._c.compress
+
+    def add(self, data: bytes) -> bytes:
+        return self._add(data) if data else b""
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+def _header(headers, name: bytes):
+    for k, v in headers:
+        if k.lower() == name:
+            return v.decode("latin-1")
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware; see module docstring.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = scope.get("headers", [])
+        content_encoding = (_header(headers, b"content-encoding") or "identity").strip().lower()
+        if content_encoding != "identity":
+            if content_encoding != "gzip" or scope.get("path") not in DECOMPRESS_PATHS:
+                response = PlainTextResponse(f"Unsupported Content-Encoding: {content_encoding}", status_code=415)
+                return await response(scope, receive, send)
+            # edit the scope in place: outer middleware (metrics) reads the route routing sets on it
+            scope["headers"] = [(k, v) for k, v in headers if k.lower() not in (b"content-encoding", b"content-length")]
+            receive = _inflating_receive(receive, REQUEST_MAX_DECOMPRESSED_MB * 1024 * 1024)
+
+        encoding = None if scope.get("method") == "HEAD" else choose_encoding(_header(headers, b"accept-encoding") or "")
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+def _inflating_receive(receive, limit: int):
+    inflater = zlib.decompressobj(31)
+    total = 0
+
+    async def wrapped():
+        nonlocal total
+        message = await receive()
+        if message["type"] != "http.request":
+            return message
+        try:
+            body = inflater.decompress(message.get("body", b""), limit - total + 1)
+            if not message.get("more_body", False):
+                body += inflater.flush()
+        except zlib.error:
+            raise HTTPException(400, "Malformed gzip request body")
+        total += len(body)
+        if total > limit or inflater.unconsumed_tail:
+            raise HTTPException(413, f"Decompressed body exceeds {limit // (1024 * 1024)} MB")
+        if not message.get("more_body", False) and not inflater.eof:
+            # body ended before the gzip trailer: do not hand on a silently shortened payload
+            raise HTTPException(400, "Truncated gzip request body")
+        return {**message, "body": body}
+
+    return wrapped
+
+
+class _CompressingSend:
+    """
+    Decides on the first body message: small, already-encoded or
+    non-compressible responses pass through unchanged.
+    """
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _eligible(self, headers) -> bool:
+        if self.start["status"] in (204, 206, 304):
+            return False
+        if _header(headers, b"content-encoding") or _header(headers, b"accept-ranges"):
+            return False
+        ctype = (_header(headers, b"content-type") or "").lower()
+        return ctype.startswith(COMPRESSIBLE_TYPES) and not ctype.startswith("text/event-stream")
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.passthrough = not self._eligible(message.get("headers", []))
+            if self.passthrough:
+                await self.send(message)
+            return
+        if self.passthrough or message["type"] != "http.response.body":
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        if self.compressor is None:
+            if not more and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.start)
+                return await self.send(message)
+            self.compressor = _Compressor(self.encoding)
+            headers = [(k, v) for k, v in self.start.get("headers", []) if k.lower() not in (b"content-length", b"vary")]
+            vary = _header(self.start.get("headers", []), b"vary")
+            headers.append((b"content-encoding", self.encoding.encode()))
+            headers.append((b"vary", (vary + ", Accept-Encoding" if vary else "Accept-Encoding").encode()))
+            await self.send({**self.start, "headers": headers})
+
+        out = self.compressor.add(body)
+        if not more:
+            out += self.compressor.finish()
+        if out or not more:
+            await self.send({"type": "http.response.body", "body": out, "more_body": more})
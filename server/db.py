@@ -1,215 +1,749 @@
-# db.py
-# Central DB management for Fingov Pro Cloud Server
-
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from urllib.parse import urlparse
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
-
-
-# -------------------------
-# DATABASE CONFIG
-# -------------------------
-
-# Default Render PostgreSQL connection (auto-connect if env var not set)
-DEFAULT_RENDER_DB = (
-    "postgresql://fingov_pro_db_user:"
-    "8331F1E5oXSItkRrJbFFmlJ5vR144iwl"
-    "@dpg-d4hdudili9vc73e562g0-a.oregon-postgres.render.com/"
-    "fingov_pro_db"
-)
-
-DATABASE_URL = os.environ.get("DATABASE_URL", DEFAULT_RENDER_DB)
-
-# SQLAlchemy Engine (for ORM or pooled access)
-engine = create_engine(
-    DATABASE_URL,
-    poolclass=StaticPool,
-    connect_args={"connect_timeout": 10},
-    echo=False
-)
-
-
-# -------------------------
-# CONNECTION HANDLER
-# -------------------------
-def get_conn():
-    """
-    Establish a PostgreSQL database connection.
-    Connects to Render's PostgreSQL using DATABASE_URL,
-    with automatic fallback to local PostgreSQL if Render connection fails.
-    """
-
-    db_url = DATABASE_URL
-
-    # Validate URL
-    result = urlparse(db_url)
-    if not all([result.scheme, result.hostname, result.path]):
-        raise RuntimeError("Invalid DATABASE_URL. Check your Render connection string.")
-
-    try:
-        # Primary Render connection
-        conn = psycopg2.connect(db_url, cursor_factory=RealDictCursor)
-        return conn
-
-    except Exception as e:
-        # Local fallback (developer use)
-        try:
-            return psycopg2.connect(
-                host="localhost",
-                dbname="fingov_local",
-                user="postgres",
-                password="postgres",
-                cursor_factory=RealDictCursor,
-            )
-        except Exception as fallback_error:
-            raise RuntimeError(
-                f"Database connection failed. Primary: {e}, Fallback: {fallback_error}"
-            )
-
-
-# -------------------------
-# INITIALIZE DATABASE STRUCTURE
-# -------------------------
-def init_db():
-    """
-    Initializes all required tables if they don't exist.
-    Safe to run multiple times.
-    """
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-
-    # ---- USERS TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            role TEXT NOT NULL,
-            full_name TEXT NOT NULL,
-            device_id TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    # ---- OTP TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS otp (
-            id SERIAL PRIMARY KEY,
-            phone TEXT UNIQUE NOT NULL,
-            otp_code TEXT NOT NULL,
-            expires_at TIMESTAMP NOT NULL
-        )
-    """)
-    conn.commit()
-
-    # ---- CLIENTS TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS clients (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-            name TEXT NOT NULL,
-            pan TEXT UNIQUE NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            address TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    # ---- PORTFOLIOS TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS portfolios (
-            id SERIAL PRIMARY KEY,
-            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
-            asset_type TEXT NOT NULL,
-            asset_name TEXT NOT NULL,
-            quantity REAL NOT NULL,
-            purchase_price REAL NOT NULL,
-            current_price REAL,
-            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    # ---- TRANSACTIONS TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            id SERIAL PRIMARY KEY,
-            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
-            transaction_type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    # ---- FINANCIAL_PLANS TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS financial_plans (
-            id SERIAL PRIMARY KEY,
-            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
-            plan_type TEXT NOT NULL,
-            goal_amount REAL NOT NULL,
-            target_date DATE NOT NULL,
-            status TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    # ---- NOTIFICATIONS TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS notifications (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-            message TEXT NOT NULL,
-            is_read BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    # ---- MARKET_DATA TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS market_data (
-            id SERIAL PRIMARY KEY,
-            symbol TEXT NOT NULL,
-            price REAL NOT NULL,
-            volume BIGINT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    # ---- REPORTS TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS reports (
-            id SERIAL PRIMARY KEY,
-            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
-            report_type TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    # ---- SYNC_LOGS TABLE ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS sync_logs (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-            sync_type TEXT NOT NULL,
-            status TEXT NOT NULL,
-            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-
-    cur.close()
-    conn.close()
+# db.py
+# Central DB management for Fingov Pro Cloud Server
+
+import os
+import time
+import datetime
+import itertools
+import threading
+import contextvars
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+from urllib.parse import urlparse
+
+from . import metrics, profiling
+
+
+# -------------------------
+# DATABASE CONFIG
+# -------------------------
+
+# Default Render PostgreSQL connection (auto-connect if env var not set)
+DEFAULT_RENDER_DB = (
+    "postgresql://fingov_pro_db_user:"
+    "8331F1E5oXSItkRrJbFFmlJ5vR144iwl"
+    "@dpg-d4hdudili9vc73e562g0-a.oregon-postgres.render.com/"
+    "fingov_pro_db"
+)
+
+DATABASE_URL = os.environ.get("DATABASE_URL", DEFAULT_RENDER_DB)
+
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "20"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# idle connections older than this are reconnected instead of reused
+DB_POOL_RECYCLE_SECONDS = float(os.environ.get("DB_POOL_RECYCLE_SECONDS", "300"))
+
+# optional streaming replicas for read-only handlers (comma-separated DSNs)
+DATABASE_REPLICA_URLS = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = int(os.environ.get("REPLICA_CHECK_SECONDS", "5"))
+
+_engine = None
+
+
+def get_engine():
+    """
+    SQLAlchemy Engine (for ORM access). Created on first use so that
+    importing db does not pay the SQLAlchemy import.
+    """
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import StaticPool
+        _engine = create_engine(
+            DATABASE_URL,
+            poolclass=StaticPool,
+            connect_args={"connect_timeout": 10},
+            echo=False
+        )
+    return _engine
+
+
+# Searchable text for the admin user listing; the trigram index in
+# init_db is built on exactly this expression so ILIKE queries can use it.
+USER_SEARCH_EXPR = "(username || ' ' || COALESCE(full_name, '') || ' ' || COALESCE(email, ''))"
+
+
+# -------------------------
+# CONNECTION HANDLER
+# -------------------------
+def _observe(sql, start: float):
+    elapsed = time.perf_counter() - start
+    metrics.observe_query(sql, elapsed)
+    profiling.record_query(sql, elapsed)
+
+
+class TimedCursor(RealDictCursor):
+    """
+    RealDictCursor that records every statement's duration in
+    metrics.db_query and the current request's profile.
+    """
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _observe(query, start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _observe(query, start)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _observe(sql, start)
+
+
+class TimedConnection(psycopg2.extensions.connection):
+    """
+    Connection whose dict cursors are TimedCursors, including call sites
+    that pass cursor_factory=RealDictCursor explicitly.
+    """
+
+    def cursor(self, *args, **kwargs):
+        if kwargs.get("cursor_factory") in (None, RealDictCursor):
+            kwargs["cursor_factory"] = TimedCursor
+        return super().cursor(*args, **kwargs)
+
+
+def connect(dsn: str = None):
+    """
+    Establish a new PostgreSQL database connection.
+    Connects to Render's PostgreSQL using DATABASE_URL,
+    with automatic fallback to local PostgreSQL if Render connection fails.
+    Long-lived users (LISTEN threads) call this directly; request code
+    uses get_conn(). With `dsn` (a replica) there is no fallback.
+    """
+    if dsn:
+        return psycopg2.connect(dsn, connection_factory=TimedConnection, cursor_factory=TimedCursor, connect_timeout=5)
+
+    db_url = DATABASE_URL
+
+    # Validate URL
+    result = urlparse(db_url)
+    if not all([result.scheme, result.hostname, result.path]):
+        raise RuntimeError("Invalid DATABASE_URL. Check your Render connection string.")
+
+    try:
+        # Primary Render connection
+        conn = psycopg2.connect(db_url, connection_factory=TimedConnection, cursor_factory=TimedCursor)
+        return conn
+
+    except Exception as e:
+        # Local fallback (developer use)
+        try:
+            return psycopg2.connect(
+                host="localhost",
+                dbname="fingov_local",
+                user="postgres",
+                password="postgres",
+                connection_factory=TimedConnection,
+                cursor_factory=TimedCursor,
+            )
+        except Exception as fallback_error:
+            raise RuntimeError(
+                f"Database connection failed. Primary: {e}, Fallback: {fallback_error}"
+            )
+
+
+class PooledConnection:
+    """
+    Proxy for a pooled psycopg2 connection. close() rolls back any open
+    transaction and returns the connection to the pool instead of
+    closing it, so existing `conn.close()` call sites keep working.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        return getattr(raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def __del__(self):
+        # handlers that raise before conn.close() must not leak a pool slot
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, maxconn: int = DB_POOL_MAX, timeout: float = DB_POOL_TIMEOUT, dsn: str = None):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.dsn = dsn
+        self._idle = []  # (raw connection, returned_at)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def acquire(self) -> PooledConnection:
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            metrics.db_checkout.observe(time.perf_counter() - start)
+            raise RuntimeError(f"Database pool exhausted ({self.maxconn} connections busy)")
+        try:
+            raw = None
+            with self._lock:
+                while self._idle and raw is None:
+                    candidate, returned_at = self._idle.pop()
+                    if candidate.closed or time.monotonic() - returned_at > DB_POOL_RECYCLE_SECONDS:
+                        try:
+                            candidate.close()
+                        except Exception:
+                            pass
+                    else:
+                        raw = candidate
+            if raw is None:
+                raw = connect(self.dsn)
+        except Exception:
+            self._slots.release()
+            raise
+        finally:
+            metrics.db_checkout.observe(time.perf_counter() - start)
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        try:
+            if raw.closed:
+                return
+            status = raw.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                raw.close()
+                return
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                raw.rollback()
+            if raw.autocommit:
+                raw.autocommit = False
+            with self._lock:
+                self._idle.append((raw, time.monotonic()))
+        except Exception:
+            try:
+                raw.close()
+            except Exception:
+                pass
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for raw, _ in idle:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+
+_pool = None
+_replicas = []
+_replica_turn = itertools.count()
+# set per request (read_your_writes middleware): route readonly work to the primary
+primary_only = contextvars.ContextVar("primary_only", default=False)
+
+
+class Replica:
+    def __init__(self, dsn: str, maxconn: int):
+        self.dsn = dsn
+        self.pool = ConnectionPool(maxconn, dsn=dsn)
+        self.healthy = False  # until the first lag check passes
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+
+    def status(self) -> dict:
+        host = urlparse(self.dsn).hostname
+        return {"host": host, "healthy": self.healthy, "lag_seconds": self.lag,
+                "error": self.error, "checked_at": self.checked_at}
+
+
+def init_pool(maxconn: int = DB_POOL_MAX):
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(maxconn)
+        _replicas[:] = [Replica(dsn, maxconn) for dsn in DATABASE_REPLICA_URLS]
+        if _replicas:
+            check_replicas()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+    for r in _replicas:
+        r.pool.close()
+    _replicas.clear()
+
+
+def check_replicas() -> dict:
+    """
+    Measure each replica's replay lag and mark it healthy or bypassed.
+    A replica that has replayed up to the primary's current WAL position
+    has no lag, even when the primary has been idle for a while.
+    """
+    primary_lsn = None
+    try:
+        conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute("SELECT pg_current_wal_lsn()::text AS lsn")
+            primary_lsn = cur.fetchone()["lsn"]
+        finally:
+            cur.close(); conn.close()
+    except Exception as e:
+        print("replica check: primary WAL position unavailable:", e)
+
+    for r in _replicas:
+        try:
+            conn = r.pool.acquire(); cur = conn.cursor()
+            try:
+                cur.execute(
+                    """
+                    SELECT pg_is_in_recovery() AS standby,
+                           pg_last_wal_replay_lsn() >= %s::pg_lsn AS caught_up,
+                           EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float AS replay_age
+                    """,
+                    (primary_lsn,),
+                )
+                row = cur.fetchone()
+            finally:
+                cur.close(); conn.close()
+            if not row["standby"] or row["caught_up"]:
+                # not a physical standby (e.g. logical subscriber): no replay lag to measure
+                r.lag = 0.0
+            else:
+                r.lag = row["replay_age"] if row["replay_age"] is not None else float("inf")
+            r.healthy = r.lag <= REPLICA_MAX_LAG_SECONDS
+            r.error = None
+        except Exception as e:
+            r.healthy, r.lag, r.error = False, None, str(e).strip()
+        r.checked_at = datetime.datetime.utcnow().isoformat(timespec="seconds")
+    return {"healthy": sum(r.healthy for r in _replicas), "replicas": len(_replicas)}
+
+
+def replica_status() -> list:
+    return [r.status() for r in _replicas]
+
+
+def _replica_conn():
+    healthy = [r for r in _replicas if r.healthy]
+    if not healthy:
+        return None
+    start = next(_replica_turn)
+    for k in range(len(healthy)):
+        r = healthy[(start + k) % len(healthy)]
+        try:
+            return r.pool.acquire()
+        except Exception as e:
+            # unreachable since the last check: bypass it until the next one
+            r.healthy, r.error = False, str(e).strip()
+    return None
+
+
+def get_conn(readonly: bool = False):
+    """
+    Connection for one unit of work; call conn.close() when done.
+    Pooled once the app has started (init_pool), a fresh connection otherwise.
+    readonly=True may return a replica connection: only for handlers that
+    never write and can tolerate REPLICA_MAX_LAG_SECONDS of staleness.
+    Requests inside a user's read-your-writes window always get the primary.
+    """
+    profiling.record_connection()
+    if readonly and _replicas and not primary_only.get():
+        conn = _replica_conn()
+        if conn is not None:
+            return conn
+    if _pool is not None:
+        return _pool.acquire()
+    return connect()
+
+
+# -------------------------
+# INITIALIZE DATABASE STRUCTURE
+# -------------------------
+def init_db():
+    """
+    Initializes all required tables if they don't exist.
+    Safe to run multiple times.
+    """
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+    # ---- USERS TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL,
+            full_name TEXT NOT NULL,
+            device_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # columns used by login and the admin user listing
+    cur.execute("""
+        ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS email TEXT,
+            ADD COLUMN IF NOT EXISTS partner_code TEXT,
+            ADD COLUMN IF NOT EXISTS last_login TIMESTAMP
+    """)
+    conn.commit()
+
+    # ---- OTP TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS otp (
+            id SERIAL PRIMARY KEY,
+            phone TEXT UNIQUE NOT NULL,
+            otp_code TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        )
+    """)
+    conn.commit()
+
+    # ---- CLIENTS TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS clients (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            pan TEXT UNIQUE NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            address TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    # ---- PORTFOLIOS TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS portfolios (
+            id SERIAL PRIMARY KEY,
+            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+            asset_type TEXT NOT NULL,
+            asset_name TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            purchase_price REAL NOT NULL,
+            current_price REAL,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    # ---- TRANSACTIONS TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id SERIAL PRIMARY KEY,
+            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+            transaction_type TEXT NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    # ---- FINANCIAL_PLANS TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS financial_plans (
+            id SERIAL PRIMARY KEY,
+            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+            plan_type TEXT NOT NULL,
+            goal_amount REAL NOT NULL,
+            target_date DATE NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    # ---- NOTIFICATIONS TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS notifications (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            message TEXT NOT NULL,
+            is_read BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications (user_id, id)")
+    # NOTIFY "notifications" on insert for SSE streams; the message is left
+    # out when it would not fit the 8000-byte NOTIFY payload limit
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION notify_notification_insert() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('notifications', json_build_object(
+                'id', NEW.id,
+                'user_id', NEW.user_id,
+                'is_read', NEW.is_read,
+                'created_at', NEW.created_at,
+                'message', CASE WHEN octet_length(NEW.message) < 7000 THEN NEW.message END
+            )::text);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_trigger
+                WHERE tgrelid = 'notifications'::regclass AND tgname = 'notifications_notify_insert'
+            ) THEN
+                CREATE TRIGGER notifications_notify_insert AFTER INSERT ON notifications
+                    FOR EACH ROW EXECUTE FUNCTION notify_notification_insert();
+            END IF;
+        END
+        $$
+    """)
+    conn.commit()
+
+    # ---- MARKET_DATA TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS market_data (
+            id SERIAL PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            price REAL NOT NULL,
+            volume BIGINT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    # ---- MARKET PRICES (bulk ingested; monthly partitions are created by market_data.py) ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS market_prices (
+            symbol TEXT NOT NULL,
+            price NUMERIC(18,6) NOT NULL,
+            volume BIGINT,
+            ts TIMESTAMP NOT NULL,
+            source TEXT,
+            ingested_at TIMESTAMP NOT NULL DEFAULT now(),
+            PRIMARY KEY (symbol, ts)
+        ) PARTITION BY RANGE (ts)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS market_latest (
+            symbol TEXT PRIMARY KEY,
+            price NUMERIC(18,6) NOT NULL,
+            volume BIGINT,
+            ts TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+    conn.commit()
+
+    # ---- REPORTS TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reports (
+            id SERIAL PRIMARY KEY,
+            client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+            report_type TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    # ---- SYNC_LOGS TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_logs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            sync_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    # ---- UPLOAD_FILES TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS upload_files (
+            file_id TEXT PRIMARY KEY,
+            sha256 TEXT UNIQUE NOT NULL,
+            size BIGINT NOT NULL,
+            ext TEXT NOT NULL DEFAULT '',
+            storage_path TEXT NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 1,
+            original_name TEXT,
+            uploaded_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_ref_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_upload_files_created_at ON upload_files (created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_upload_files_last_ref_at ON upload_files (last_ref_at)")
+    conn.commit()
+
+    # ---- UPLOAD_SESSIONS TABLES ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            session_id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            total_size BIGINT NOT NULL,
+            sha256 TEXT NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            uploaded_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS upload_session_chunks (
+            session_id TEXT NOT NULL REFERENCES upload_sessions(session_id) ON DELETE CASCADE,
+            chunk_offset BIGINT NOT NULL,
+            length INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (session_id, chunk_offset)
+        )
+    """)
+    cur.execute("ALTER TABLE upload_sessions ADD COLUMN IF NOT EXISTS completed_file_id TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated_at ON upload_sessions (updated_at)")
+    conn.commit()
+
+    # ---- PARTNER COUNTER DELTAS (append-only, merged into d2na_partners) ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS d2na_partner_counter_deltas (
+            id BIGSERIAL PRIMARY KEY,
+            partner_code TEXT NOT NULL,
+            pan_delta INTEGER NOT NULL DEFAULT 0,
+            kotak_delta INTEGER NOT NULL DEFAULT 0,
+            total_delta INTEGER NOT NULL DEFAULT 0,
+            activity_date DATE NOT NULL DEFAULT CURRENT_DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # tables created before the leaderboard have no activity_date yet
+    cur.execute("""
+        ALTER TABLE d2na_partner_counter_deltas
+            ADD COLUMN IF NOT EXISTS activity_date DATE NOT NULL DEFAULT CURRENT_DATE
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_partner_counter_deltas_code ON d2na_partner_counter_deltas (partner_code)")
+    conn.commit()
+
+    # ---- PARTNER_DAILY_STATS TABLE (leaderboard aggregates) ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS partner_daily_stats (
+            partner_code TEXT NOT NULL,
+            day DATE NOT NULL,
+            pan_count BIGINT NOT NULL DEFAULT 0,
+            kotak_count BIGINT NOT NULL DEFAULT 0,
+            total_transactions BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (partner_code, day)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_partner_daily_stats_day ON partner_daily_stats (day)")
+    conn.commit()
+
+    # ---- ADMIN_AUDIT TABLE ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS admin_audit (
+            id BIGSERIAL PRIMARY KEY,
+            actor_username TEXT,
+            action TEXT NOT NULL,
+            target TEXT,
+            details TEXT,
+            ip_address TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    # ---- SYNC PUSH LEDGER ----
+    # one row per pushed desktop record; makes re-sent push batches idempotent
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_push_ledger (
+            device_id TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            local_id TEXT NOT NULL,
+            remote_id BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (device_id, table_name, local_id)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sync_push_ledger_created ON sync_push_ledger (created_at)")
+    conn.commit()
+
+    # ---- SCHEDULED JOB RUNS ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS scheduled_job_runs (
+            job_name TEXT PRIMARY KEY,
+            last_started_at TIMESTAMP,
+            last_duration_ms INTEGER,
+            last_rows BIGINT,
+            last_status TEXT,
+            last_error TEXT,
+            runner TEXT,
+            run_count BIGINT DEFAULT 0
+        )
+    """)
+    conn.commit()
+
+    # ---- USER SEARCH INDEXES ----
+    _try_ddl(conn, "CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    _try_ddl(conn, f"CREATE INDEX IF NOT EXISTS idx_users_search_trgm ON users USING gin (({USER_SEARCH_EXPR}) gin_trgm_ops)")
+    _try_ddl(conn, "CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)")
+    _try_ddl(conn, "CREATE INDEX IF NOT EXISTS idx_users_partner_code ON users (partner_code)")
+
+    # ---- INDEXES ON EXTERNALLY MANAGED TABLES ----
+    ensure_partner_indexes(conn)
+
+    cur.close()
+    conn.close()
+
+
+def _table_exists(cur, name: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) AS t", (name,))
+    return cur.fetchone()["t"] is not None
+
+
+def _try_ddl(conn, sql: str):
+    """
+    Run optional DDL (extensions, indexes); failures such as missing
+    privileges are logged and rolled back instead of aborting startup.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(sql)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("optional DDL skipped:", e)
+    finally:
+        cur.close()
+
+
+def ensure_partner_indexes(conn):
+    """
+    Indexes backing the partner listing: keyset on partner_code (unique),
+    ETag on last_update, mobile prefix and partner_name substring search.
+    """
+    cur = conn.cursor()
+    exists = _table_exists(cur, "d2na_partners")
+    cur.close()
+    if not exists:
+        return
+    _try_ddl(conn, "CREATE INDEX IF NOT EXISTS idx_d2na_partners_last_update ON d2na_partners (last_update)")
+    _try_ddl(conn, "CREATE INDEX IF NOT EXISTS idx_d2na_partners_mobile ON d2na_partners (mobile text_pattern_ops)")
+    _try_ddl(conn, "CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    _try_ddl(conn, "CREATE INDEX IF NOT EXISTS idx_d2na_partners_name_trgm ON d2na_partners USING gin (partner_name gin_trgm_ops)")
@@ -0,0 +1,67 @@
+# fastjson.py
+"""
+orjson-backed JSON responses.
+
+ORJSONResponse is the app's default response class. orjson serializes
+datetime/date/UUID natively and dict subclasses (RealDictRow) without
+copying them. Handlers that return a Response directly also skip
+FastAPI's jsonable_encoder pass, which is the expensive part for large
+row lists.
+
+stream_json_array() writes a JSON array straight from cursor batches, so
+unbounded results (sync pull) never exist in memory as a whole list.
+"""
+
+import decimal
+
+import orjson
+from starlette.responses import JSONResponse, StreamingResponse
+
+STREAM_BATCH_SIZE = 1000
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, memoryview)):
+        return bytes(obj).decode(errors="replace")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj) -> bytes:
+    return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def iter_json_array(cur, transform=None, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Yield a JSON array of the cursor's remaining rows, one chunk per
+    fetchmany() batch. transform(row) may edit the row in place or
+    return another object to serialize.
+    """
+    yield b"["
+    first = True
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        if transform is not None:
+            rows = [transform(r) for r in rows]
+        chunk = dumps(rows)[1:-1]  # batch as one call, brackets stripped
+        if chunk:
+            yield chunk if first else b"," + chunk
+            first = False
+    yield b"]"
+
+
+def stream_json(chunks, status_code: int = 200, headers: dict = None) -> StreamingResponse:
+    return StreamingResponse(chunks, status_code=status_code, headers=headers, media_type="application/json")
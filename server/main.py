@@ -1,50 +1,123 @@
-# main.py
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from .db import init_db
-from .auth_router import router as auth_router
-from .otp_router import router as otp_router
-from .template_router import router as template_router
-from .partners_router import router as partners_router
-from .sync_router import router as sync_router
-from .wa_router import router as wa_router
-from .version_admin_router import router as version_admin_router   # ⭐ NEW
-
-app = FastAPI(title="FINGOV PRO CLOUD SERVER", version="2.0")
-
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# ---- INIT DB ----
-init_db()
-
-# ---- ROUTERS ----
-app.include_router(auth_router, prefix="/auth")
-app.include_router(otp_router, prefix="/auth")
-app.include_router(template_router, prefix="/admin")
-app.include_router(partners_router, prefix="/partners")
-app.include_router(sync_router, prefix="/sync")
-app.include_router(wa_router, prefix="")
-
-# ⭐ NEW VERSION ADMIN ROUTER
-app.include_router(version_admin_router, prefix="/version-admin")
-
-@app.get("/")
-def root():
-    return {"status": "ok", "server": "FINGOV PRO CLOUD 2.0"}
-
-@app.post("/auth")
-
-def auth_status():
-        return {"status": "ok", "message": "Authentication service is running"}
-
-
-
-
-
-
+# main.py
+import os
+import hmac
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from . import metrics
+from .profiling import ProfilingMiddleware
+from .fastjson import ORJSONResponse
+from .compression import CompressionMiddleware
+from .read_your_writes import ReadYourWritesMiddleware
+from .db import init_db, init_pool, close_pool, check_replicas, DATABASE_REPLICA_URLS, REPLICA_CHECK_SECONDS
+from .background import register_job, start_jobs, stop_jobs
+from . import maintenance
+from .pubsub import start_listener, stop_listener
+from . import audit
+from .uploads.sweeper import sweep_uploads, SWEEP_INTERVAL_SECONDS
+from .uploads.sessions import gc_stale_sessions
+from .partner_counters import merge_counter_deltas, MERGE_INTERVAL_SECONDS
+from .auth_router import router as auth_router
+from .otp_router import router as otp_router
+from .template_router import router as template_router
+from .partners_router import router as partners_router
+from .sync_router import router as sync_router
+from .wa_router import router as wa_router
+from .upload_router import router as upload_router
+from .admin_router import router as admin_router
+from .notifications_router import router as notifications_router
+from .market_router import router as market_router
+from .dependencies import require_role
+from .version_admin_router import router as version_admin_router   # ⭐ NEW
+
+# bearer token required by /metrics when set; leave unset on private networks
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+# ---- BACKGROUND JOBS ----
+def _register_jobs():
+    register_job("upload_sweeper", SWEEP_INTERVAL_SECONDS, sweep_uploads)
+    register_job("upload_session_gc", 3600, gc_stale_sessions)
+    register_job("partner_counter_merge", MERGE_INTERVAL_SECONDS, merge_counter_deltas)
+    for name, fn in maintenance.JOBS.items():
+        register_job(name, maintenance.CLEANUP_INTERVAL_SECONDS, fn)
+    if DATABASE_REPLICA_URLS:
+        # replica health is per-worker state: every worker checks
+        register_job("replica_lag_check", REPLICA_CHECK_SECONDS, check_replicas, leader_only=False)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per-worker setup/teardown. Nothing touches the database at import
+    time; the pool, schema check, listener and jobs start here.
+    """
+    init_pool()
+    init_db()
+    audit.start()
+    start_listener()
+    _register_jobs()
+    start_jobs()
+    try:
+        yield
+    finally:
+        stop_jobs()
+        stop_listener()
+        audit.stop()
+        close_pool()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="FINGOV PRO CLOUD SERVER",
+        version="2.0",
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
+    )
+
+    # CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(ReadYourWritesMiddleware)
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_middleware(ProfilingMiddleware)
+
+    # ---- ROUTERS ----
+    app.include_router(auth_router, prefix="/auth")
+    app.include_router(otp_router, prefix="/auth")
+    app.include_router(template_router, prefix="/admin")
+    app.include_router(partners_router, prefix="/partners")
+    app.include_router(sync_router, prefix="/sync")
+    app.include_router(wa_router, prefix="")
+    app.include_router(upload_router, prefix="/uploads")
+    app.include_router(notifications_router, prefix="/notifications")
+    app.include_router(market_router, prefix="/market")
+    app.include_router(admin_router, prefix="", dependencies=[Depends(require_role("ADMIN"))])
+
+    # ⭐ NEW VERSION ADMIN ROUTER
+    app.include_router(version_admin_router, prefix="/version-admin")
+
+    @app.get("/")
+    def root():
+        return {"status": "ok", "server": "FINGOV PRO CLOUD 2.0"}
+
+    @app.post("/auth")
+    def auth_status():
+        return {"status": "ok", "message": "Authentication service is running"}
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint(authorization: str = Header(None)):
+        if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+
+app = create_app()
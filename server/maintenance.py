@@ -0,0 +1,115 @@
+# maintenance.py
+"""
+Retention cleanup jobs run by the scheduler (leader only).
+
+Every job deletes in batches of CLEANUP_BATCH_SIZE rows, committing each
+batch, and stops after CLEANUP_MAX_BATCHES per run, so no run holds
+locks for long or competes with request traffic; whatever is left is
+picked up on the next run. Tables that a deployment does not have are
+skipped.
+"""
+
+import os
+
+from .db import get_conn
+
+CLEANUP_INTERVAL_SECONDS = int(os.environ.get("CLEANUP_INTERVAL_MINUTES", "60")) * 60
+CLEANUP_BATCH_SIZE = int(os.environ.get("CLEANUP_BATCH_SIZE", "1000"))
+CLEANUP_MAX_BATCHES = int(os.environ.get("CLEANUP_MAX_BATCHES", "50"))
+
+REVOKED_TOKEN_RETENTION_DAYS = int(os.environ.get("REVOKED_TOKEN_RETENTION_DAYS", "7"))
+OTP_RETENTION_HOURS = int(os.environ.get("OTP_RETENTION_HOURS", "24"))
+NOTIFICATION_READ_RETENTION_DAYS = int(os.environ.get("NOTIFICATION_READ_RETENTION_DAYS", "30"))
+NOTIFICATION_MAX_AGE_DAYS = int(os.environ.get("NOTIFICATION_MAX_AGE_DAYS", "180"))
+SYNC_LEDGER_RETENTION_DAYS = int(os.environ.get("SYNC_LEDGER_RETENTION_DAYS", "30"))
+
+
+def delete_in_batches(table: str, where_sql: str, params: tuple = (),
+                      batch_size: int = CLEANUP_BATCH_SIZE, max_batches: int = CLEANUP_MAX_BATCHES) -> int:
+    """
+    DELETE FROM table WHERE <where_sql>, batch_size rows per transaction.
+    Rows locked by other transactions are skipped, not waited for.
+    Returns the number of rows deleted.
+    """
+    deleted = 0
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("SELECT to_regclass(%s) AS t", (table,))
+        if cur.fetchone()["t"] is None:
+            return 0
+        for _ in range(max_batches):
+            cur.execute(
+                f"""
+                DELETE FROM {table} WHERE ctid = ANY(ARRAY(
+                    SELECT ctid FROM {table}
+                    WHERE {where_sql}
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ))
+                """,
+                params + (batch_size,),
+            )
+            n = cur.rowcount
+            conn.commit()
+            deleted += n
+            if n < batch_size:
+                break
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close(); conn.close()
+    return deleted
+
+
+def cleanup_refresh_tokens() -> dict:
+    """
+    Expired tokens, and revoked ones after REVOKED_TOKEN_RETENTION_DAYS.
+    """
+    return {"rows": delete_in_batches(
+        "refresh_tokens",
+        "expires_at < now() AT TIME ZONE 'UTC'"
+        " OR (revoked AND issued_at < now() AT TIME ZONE 'UTC' - make_interval(days => %s))",
+        (REVOKED_TOKEN_RETENTION_DAYS,),
+    )}
+
+
+def cleanup_password_otps() -> dict:
+    # expires_at is written as a UTC ISO string
+    return {"rows": delete_in_batches(
+        "password_otps",
+        "expires_at::timestamp < now() AT TIME ZONE 'UTC' - make_interval(hours => %s)",
+        (OTP_RETENTION_HOURS,),
+    )}
+
+
+def cleanup_notifications() -> dict:
+    """
+    Read notifications after NOTIFICATION_READ_RETENTION_DAYS, any
+    notification after NOTIFICATION_MAX_AGE_DAYS.
+    """
+    return {"rows": delete_in_batches(
+        "notifications",
+        "(is_read AND created_at < now() - make_interval(days => %s))"
+        " OR created_at < now() - make_interval(days => %s)",
+        (NOTIFICATION_READ_RETENTION_DAYS, NOTIFICATION_MAX_AGE_DAYS),
+    )}
+
+
+def cleanup_sync_ledger() -> dict:
+    """
+    Push ledger entries older than any batch a desktop would still retry.
+    """
+    return {"rows": delete_in_batches(
+        "sync_push_ledger",
+        "created_at < now() - make_interval(days => %s)",
+        (SYNC_LEDGER_RETENTION_DAYS,),
+    )}
+
+
+JOBS = {
+    "cleanup_refresh_tokens": cleanup_refresh_tokens,
+    "cleanup_password_otps": cleanup_password_otps,
+    "cleanup_notifications": cleanup_notifications,
+    "cleanup_sync_ledger": cleanup_sync_ledger,
+}
@@ -0,0 +1,352 @@
+# market_data.py
+"""
+Bulk price ingestion and the latest-price cache.
+
+Batches (CSV with a header row, or NDJSON) are validated in Python,
+COPYed into a temp stage and merged into market_prices, which is
+range-partitioned by month on ts. Missing monthly partitions are created
+in their own short transaction first, so the load never holds the lock
+on the parent table that partition DDL takes. The same transaction
+advances market_latest (one row per symbol) only where the batch is
+newer than what is stored.
+
+Each worker keeps market_latest in a dict, so current price lookups are
+a single dict hit. Ingests NOTIFY `market_latest_changed` with the rows
+they advanced (or an empty payload when that does not fit a NOTIFY);
+workers apply the rows or reload. The TTL and a reload after a listener
+reconnect bound staleness if a notification is ever missed.
+"""
+
+import io
+import os
+import csv
+import json
+import time
+import decimal
+import datetime
+import threading
+
+import orjson
+
+from .db import get_conn
+from .pubsub import subscribe, on_reconnect, notify
+
+MARKET_CACHE_TTL = float(os.environ.get("MARKET_CACHE_TTL", "300"))
+CHANNEL = "market_latest_changed"
+NOTIFY_MAX_BYTES = 7900  # pg_notify payloads must stay under 8000 bytes
+SYMBOL_MAX_LEN = 32
+PRICE_LIMIT = decimal.Decimal("1e12")  # market_prices.price is NUMERIC(18,6)
+BIGINT_MAX = 2 ** 63 - 1
+TS_FIELDS = ("ts", "timestamp", "date")
+
+_latest = {}  # symbol -> {"symbol", "price", "volume", "ts"}
+_loaded_at = None  # monotonic time of the last full load, None = not loaded
+_generation = 0
+_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_partitions = set()  # months whose partition this worker has already ensured
+
+
+# ---- PARSING ----
+def _parse_ts(value) -> datetime.datetime:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.datetime.utcfromtimestamp(value)
+    text = str(value).strip()
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    ts = datetime.datetime.fromisoformat(text)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _validate(rec: dict):
+    """
+    (symbol, price, volume, ts) for one record, or raise ValueError.
+    """
+    symbol = str(rec.get("symbol") or "").strip().upper()
+    if not symbol:
+        raise ValueError("symbol required")
+    if len(symbol) > SYMBOL_MAX_LEN:
+        raise ValueError("symbol too long")
+
+    raw_price = rec.get("price")
+    if raw_price is None or raw_price == "":
+        raise ValueError("price required")
+    try:
+        price = decimal.Decimal(str(raw_price).strip())
+    except decimal.InvalidOperation:
+        raise ValueError("invalid price")
+    if not price.is_finite() or price < 0 or price >= PRICE_LIMIT:
+        raise ValueError("invalid price")
+
+    volume = rec.get("volume")
+    if volume is None or volume == "":
+        volume = None
+    else:
+        try:
+            v = decimal.Decimal(str(volume).strip())
+        except decimal.InvalidOperation:
+            raise ValueError("invalid volume")
+        if not v.is_finite() or v != v.to_integral_value() or v < 0 or v > BIGINT_MAX:
+            raise ValueError("invalid volume")
+        volume = int(v)
+
+    raw_ts = next((rec[f] for f in TS_FIELDS if rec.get(f) not in (None, "")), None)
+    if raw_ts is None:
+        raise ValueError("ts required")
+    try:
+        ts = _parse_ts(raw_ts)
+    except (ValueError, TypeError, OverflowError, OSError):
+        raise ValueError("invalid ts")
+    return symbol, price, volume, ts
+
+
+def _iter_records(raw: bytes, fmt: str):
+    """
+    Yield (row_no, record) pairs; a record that cannot be decoded is
+    yielded as a ValueError.
+    """
+    if fmt == "ndjson":
+        for row_no, line in enumerate(raw.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                rec = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                yield row_no, ValueError("invalid JSON")
+                continue
+            yield row_no, rec if isinstance(rec, dict) else ValueError("expected a JSON object")
+    else:
+        reader = csv.DictReader(io.StringIO(raw.decode("utf-8-sig")))
+        if reader.fieldnames:
+            reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+        for row_no, rec in enumerate(reader, 2):  # row 1 is the header
+            yield row_no, rec
+
+
+def parse_batch(raw: bytes, fmt: str):
+    """
+    Validate a CSV or NDJSON batch. Returns (stage, months, received,
+    errors): stage is a CSV buffer of accepted rows ready for COPY and
+    months the first days of the months they fall in.
+    """
+    stage = io.StringIO()
+    w = csv.writer(stage)
+    months, errors, received = set(), [], 0
+    for row_no, rec in _iter_records(raw, fmt):
+        received += 1
+        try:
+            if isinstance(rec, ValueError):
+                raise rec
+            symbol, price, volume, ts = _validate(rec)
+        except ValueError as e:
+            errors.append({"row": row_no, "error": str(e)})
+            continue
+        w.writerow((row_no, symbol, str(price), "" if volume is None else volume, ts.isoformat(sep=" ")))
+        months.add(ts.date().replace(day=1))
+    stage.seek(0)
+    return stage, months, received, errors
+
+
+# ---- PARTITIONS ----
+def _next_month(d: datetime.date) -> datetime.date:
+    return (d.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def ensure_partitions(months) -> list:
+    """
+    Create the monthly market_prices partitions that are missing for the
+    given month starts. Runs and commits on its own connection; returns
+    the partitions created.
+    """
+    missing = sorted(set(months) - _partitions)
+    if not missing:
+        return []
+    created = []
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        # serialize with other workers creating the same partition
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('market_prices_partitions'))")
+        for month in missing:
+            name = f"market_prices_{month:%Y%m}"
+            cur.execute("SELECT to_regclass(%s) AS t", (name,))
+            if cur.fetchone()["t"] is None:
+                cur.execute(
+                    f"CREATE TABLE {name} PARTITION OF market_prices FOR VALUES FROM (%s) TO (%s)",
+                    (month, _next_month(month)),
+                )
+                created.append(name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close(); conn.close()
+    _partitions.update(missing)
+    return created
+
+
+# ---- LOADING ----
+def load_batch(stage, source: str = None) -> dict:
+    """
+    COPY a parse_batch() stage into market_prices and advance
+    market_latest. A (symbol, ts) given twice keeps the later row;
+    existing rows for the same (symbol, ts) are overwritten.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE market_stage (
+                row_no INTEGER,
+                symbol TEXT,
+                price NUMERIC(18,6),
+                volume BIGINT,
+                ts TIMESTAMP
+            ) ON COMMIT DROP
+        """)
+        cur.copy_expert("COPY market_stage FROM STDIN WITH (FORMAT csv)", stage)
+        # rows go in (symbol, ts) order so concurrent loads lock keys in the same order
+        cur.execute("""
+            WITH up AS (
+                INSERT INTO market_prices AS p (symbol, price, volume, ts, source, ingested_at)
+                SELECT symbol, price, volume, ts, %s, now() FROM (
+                    SELECT DISTINCT ON (symbol, ts) symbol, price, volume, ts
+                    FROM market_stage ORDER BY symbol, ts, row_no DESC
+                ) batch
+                ON CONFLICT (symbol, ts) DO UPDATE SET
+                    price = excluded.price,
+                    volume = excluded.volume,
+                    source = excluded.source,
+                    ingested_at = excluded.ingested_at
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+                   COUNT(*) FILTER (WHERE NOT inserted) AS updated
+            FROM up
+        """, (source,))
+        counts = dict(cur.fetchone())
+        cur.execute("""
+            INSERT INTO market_latest AS l (symbol, price, volume, ts, updated_at)
+            SELECT DISTINCT ON (symbol) symbol, price, volume, ts, now()
+            FROM market_stage ORDER BY symbol, ts DESC, row_no DESC
+            ON CONFLICT (symbol) DO UPDATE SET
+                price = excluded.price,
+                volume = excluded.volume,
+                ts = excluded.ts,
+                updated_at = excluded.updated_at
+            WHERE excluded.ts >= l.ts
+            RETURNING symbol, price, volume, ts
+        """)
+        advanced = cur.fetchall()
+        if advanced:
+            notify(cur, CHANNEL, _notify_payload(advanced))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close(); conn.close()
+    _apply(advanced)
+    counts["latest_updated"] = len(advanced)
+    return counts
+
+
+# ---- LATEST-PRICE CACHE ----
+def _notify_payload(rows) -> str:
+    payload = json.dumps(
+        [[r["symbol"], str(r["price"]), r["volume"], r["ts"].isoformat()] for r in rows],
+        separators=(",", ":"),
+    )
+    return payload if len(payload.encode()) <= NOTIFY_MAX_BYTES else ""
+
+
+def _apply(rows):
+    """
+    Merge advanced rows into the cache, keeping whichever ts is newer.
+    """
+    global _generation
+    with _lock:
+        _generation += 1  # an in-flight reload may predate these rows
+        if _loaded_at is None:
+            return  # the next lookup loads everything
+        for r in rows:
+            cur = _latest.get(r["symbol"])
+            if cur is None or r["ts"] >= cur["ts"]:
+                _latest[r["symbol"]] = {
+                    "symbol": r["symbol"], "price": r["price"], "volume": r["volume"], "ts": r["ts"],
+                }
+
+
+def _on_notify(payload: str):
+    if not payload:
+        invalidate()
+        return
+    try:
+        rows = [
+            {"symbol": s, "price": decimal.Decimal(p), "volume": v, "ts": datetime.datetime.fromisoformat(t)}
+            for s, p, v, t in json.loads(payload)
+        ]
+    except (ValueError, TypeError, decimal.InvalidOperation):
+        invalidate()
+        return
+    _apply(rows)
+
+
+def invalidate():
+    """
+    Drop the cache; the next lookup reloads market_latest.
+    """
+    global _generation, _loaded_at
+    with _lock:
+        _generation += 1
+        _loaded_at = None
+
+
+def _load():
+    global _latest, _loaded_at
+    with _reload_lock:
+        if _loaded_at is not None and _loaded_at + MARKET_CACHE_TTL > time.monotonic():
+            return _latest  # another thread reloaded meanwhile
+        gen = _generation
+        conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute("SELECT symbol, price, volume, ts FROM market_latest")
+            latest = {r["symbol"]: dict(r) for r in cur.fetchall()}
+        finally:
+            cur.close(); conn.close()
+        with _lock:
+            # keep the cache unloaded if rows were applied or invalidated meanwhile
+            if gen == _generation:
+                _latest = latest
+                _loaded_at = time.monotonic()
+        return latest
+
+
+def _snapshot() -> dict:
+    loaded_at = _loaded_at
+    if loaded_at is None or loaded_at + MARKET_CACHE_TTL <= time.monotonic():
+        return _load()
+    return _latest
+
+
+def get_latest(symbol: str):
+    """
+    Latest {"symbol", "price", "volume", "ts"} for symbol, or None.
+    Cached values are shared - treat them as read-only.
+    """
+    return _snapshot().get(symbol.strip().upper())
+
+
+def get_latest_many(symbols) -> dict:
+    latest = _snapshot()
+    out = {}
+    for s in symbols:
+        row = latest.get(s.strip().upper())
+        if row is not None:
+            out[row["symbol"]] = row
+    return out
+
+
+subscribe(CHANNEL, _on_notify)
+on_reconnect(invalidate)
@@ -0,0 +1,96 @@
+# market_router.py
+from fastapi import APIRouter, Depends, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from .dependencies import get_current_user, require_role
+from . import market_data, audit
+import csv
+import os
+
+router = APIRouter()
+
+MARKET_INGEST_MAX_ROWS = int(os.environ.get("MARKET_INGEST_MAX_ROWS", "1000000"))
+INGEST_MAX_ERRORS = 100
+LATEST_MAX_SYMBOLS = 500
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def _ingest(raw: bytes, fmt: str, source: Optional[str]) -> dict:
+    stage, months, received, errors = market_data.parse_batch(raw, fmt)
+    counts = {"inserted": 0, "updated": 0, "latest_updated": 0}
+    partitions = []
+    if months:
+        partitions = market_data.ensure_partitions(months)
+        counts = market_data.load_batch(stage, source)
+    return {
+        "status": "ok",
+        "received": received,
+        **counts,
+        "rejected": len(errors),
+        "errors": errors[:INGEST_MAX_ERRORS],
+        "partitions_created": partitions,
+    }
+
+
+@router.post("/ingest")
+async def ingest_prices(
+    request: Request,
+    source: Optional[str] = None,
+    current_user: dict = Depends(require_role("ADMIN")),
+):
+    """
+    Bulk load prices/NAVs.
+    Accepts a text/csv body with a header row, an NDJSON body
+    (application/x-ndjson), or a multipart upload with a `file` field
+    (.ndjson/.jsonl files are read as NDJSON, anything else as CSV).
+    Fields: symbol, price, ts (or timestamp/date), optional volume.
+    Returns inserted/updated/rejected counts and per-row errors.
+    """
+    ctype = request.headers.get("content-type", "")
+    if ctype.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(400, "multipart upload needs a `file` field")
+        name = (upload.filename or "").lower()
+        fmt = "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+        raw = await upload.read()
+    elif ctype.startswith("text/csv"):
+        fmt, raw = "csv", await request.body()
+    elif ctype.startswith(NDJSON_TYPES):
+        fmt, raw = "ndjson", await request.body()
+    else:
+        raise HTTPException(415, "Send text/csv, application/x-ndjson or a multipart file")
+
+    # cheap upper bound before parsing anything
+    if raw.count(b"\n") > MARKET_INGEST_MAX_ROWS + 1:
+        raise HTTPException(413, f"Too many rows. Max {MARKET_INGEST_MAX_ROWS} per batch.")
+    try:
+        result = await run_in_threadpool(_ingest, raw, fmt, source)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(400, f"Could not parse upload: {e}")
+    except Exception as e:
+        raise HTTPException(500, f"Database error: {e}")
+    audit.log_admin_action(current_user, request, "market_ingest", source or "", {
+        k: result[k] for k in ("received", "inserted", "updated", "latest_updated", "rejected")
+    })
+    return result
+
+
+@router.get("/latest")
+def latest_prices(symbols: str, current_user: dict = Depends(get_current_user)):
+    """
+    Latest price per symbol for ?symbols=A,B,C; unknown symbols are omitted.
+    """
+    wanted = [s for s in symbols.split(",") if s.strip()]
+    if len(wanted) > LATEST_MAX_SYMBOLS:
+        raise HTTPException(400, f"At most {LATEST_MAX_SYMBOLS} symbols per request")
+    return {"prices": market_data.get_latest_many(wanted)}
+
+
+@router.get("/latest/{symbol}")
+def latest_price(symbol: str, current_user: dict = Depends(get_current_user)):
+    row = market_data.get_latest(symbol)
+    if row is None:
+        raise HTTPException(404, "No price for symbol")
+    return row
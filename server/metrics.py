@@ -0,0 +1,152 @@
+# metrics.py
+"""
+In-process request/DB/integration metrics in Prometheus text format.
+
+Counters and histograms are plain dicts keyed by label tuples behind a
+lock, so recording costs a bisect and two additions. Each worker keeps
+its own registry; scrape every worker (or run one worker per
+container) to aggregate.
+"""
+
+import time
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for lv, v in items:
+            yield f"{self.name}{_labels(self.labelnames, lv)} {v}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labelvalues)
+            if s is None:
+                s = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[idx] += 1
+            s[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(lv, list(s)) for lv, s in self._series.items()]
+        for lv, s in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s[:-1]):
+                cumulative += n
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(bound))
+                yield f"{self.name}_bucket{_labels(self.labelnames, lv, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, lv)} {s[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, lv)} {cumulative}"
+
+
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+db_checkout = Histogram("db_pool_checkout_seconds", "Time spent waiting for a pooled DB connection.", (), DB_BUCKETS)
+db_query = Histogram("db_query_duration_seconds", "DB statement execution time by statement kind.", ("kind",), DB_BUCKETS)
+external_calls = Histogram("external_call_duration_seconds", "Latency of WhatsApp gateway and SMTP calls.", ("service", "outcome"))
+
+REGISTRY = [http_requests, http_latency, db_checkout, db_query, external_calls]
+
+
+def render() -> str:
+    lines = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+_QUERY_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY", "CREATE", "ALTER", "LOCK", "TRUNCATE", "EXPLAIN", "LISTEN", "SAVEPOINT", "RELEASE", "ROLLBACK"}
+
+
+def observe_query(sql, seconds: float):
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    kind = sql.lstrip().split(None, 1)[0].upper() if sql and sql.strip() else "OTHER"
+    db_query.observe(seconds, kind if kind in _QUERY_KINDS else "OTHER")
+
+
+class timed_call:
+    """
+    with timed_call("whatsapp") as t: ...; t.ok = False on failure
+    """
+
+    def __init__(self, service: str):
+        self.service = service
+        self.ok = True
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ok = self.ok and exc_type is None
+        external_calls.observe(time.perf_counter() - self._start, self.service, "ok" if ok else "error")
+        return False
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording count, latency and status per route
+    template (e.g. /sync/sync/push), not per raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_latency.observe(time.perf_counter() - start, method, template)
+            http_requests.inc(method, template, str(status[0]))
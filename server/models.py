@@ -1,110 +1,143 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-
-
-# -------------------------
-# AUTH MODELS
-# -------------------------
-
-class LoginPayload(BaseModel):
-    username: str
-    password: str
-    device_id: Optional[str] = None
-
-
-class RefreshPayload(BaseModel):
-    refresh_token: str
-
-
-class TokenResponse(BaseModel):
-    access_token: str
-    refresh_token: Optional[str] = None
-    token_type: str = "bearer"
-
-
-# -------------------------
-# OTP MODELS
-# -------------------------
-
-class OTPSendRequest(BaseModel):
-    mobile: str
-
-
-class OTPVerifyRequest(BaseModel):
-    mobile: str
-    otp: str
-
-
-class OTPStatusResponse(BaseModel):
-    success: bool
-    message: str
-
-
-# -------------------------
-# PARTNERS MODELS
-# -------------------------
-
-class PartnerCreate(BaseModel):
-    name: str
-    mobile: str
-    email: Optional[EmailStr]
-    address: Optional[str]
-
-
-class PartnerResponse(BaseModel):
-    id: int
-    name: str
-    mobile: str
-    email: Optional[EmailStr]
-    address: Optional[str]
-
-
-# -------------------------
-# TEMPLATE MODELS
-# -------------------------
-
-class TemplatePayload(BaseModel):
-    template_name: str
-    variables: Optional[dict]
-
-
-class TemplateGenericPayload(BaseModel):
-    data: Optional[dict]
-
-
-# -------------------------
-# SYNC MODELS
-# -------------------------
-
-class SyncClientPayload(BaseModel):
-    client_id: str
-    version: Optional[str]
-    data: Optional[dict]
-
-
-class SyncPushPayload(BaseModel):
-    data: Optional[dict]
-
-
-class SyncPullPayload(BaseModel):
-    data: Optional[dict]
-
-
-class SyncResponse(BaseModel):
-    status: str
-    message: str
-    payload: Optional[dict]
-
-
-# -------------------------
-# WHATSAPP MODELS
-# -------------------------
-
-class WhatsAppMessagePayload(BaseModel):
-    mobile: str
-    message: str
-
-
-class WhatsAppTemplatePayload(BaseModel):
-    template_id: str
-    parameters: List[str]
+from pydantic import BaseModel, EmailStr
+from typing import Optional, List, Union
+
+
+# -------------------------
+# AUTH MODELS
+# -------------------------
+
+class LoginPayload(BaseModel):
+    username: str
+    password: str
+    device_id: Optional[str] = None
+
+
+class RefreshPayload(BaseModel):
+    refresh_token: str
+
+
+class TokenResponse(BaseModel):
+    access_token: str
+    refresh_token: Optional[str] = None
+    token_type: str = "bearer"
+
+
+# -------------------------
+# OTP MODELS
+# -------------------------
+
+class OTPSendRequest(BaseModel):
+    mobile: str
+    lang: Optional[str] = "en"
+
+
+class OTPVerifyRequest(BaseModel):
+    mobile: str
+    otp: str
+
+
+class OTPStatusResponse(BaseModel):
+    success: bool
+    message: str
+
+
+# -------------------------
+# PARTNERS MODELS
+# -------------------------
+
+class PartnerCreate(BaseModel):
+    name: str
+    mobile: str
+    email: Optional[EmailStr]
+    address: Optional[str]
+
+
+class PartnerResponse(BaseModel):
+    id: int
+    name: str
+    mobile: str
+    email: Optional[EmailStr]
+    address: Optional[str]
+
+
+# -------------------------
+# TEMPLATE MODELS
+# -------------------------
+
+class TemplatePayload(BaseModel):
+    template_name: str
+    variables: Optional[dict]
+
+
+class TemplateGenericPayload(BaseModel):
+    key: str = ""
+    template: str = ""
+    data: Optional[dict] = None
+
+
+# -------------------------
+# SYNC MODELS
+# -------------------------
+
+class SyncClientPayload(BaseModel):
+    client_id: str
+    version: Optional[str]
+    data: Optional[dict]
+
+
+class SyncPushItem(BaseModel):
+    local_id: Union[int, str]
+    data: dict
+
+
+class SyncPushPayload(BaseModel):
+    device_id: str
+    table: str
+    items: List[SyncPushItem] = []
+
+
+class SyncPullPayload(BaseModel):
+    device_id: Optional[str] = None
+    since: Optional[str] = None
+    data: Optional[dict] = None
+
+
+class SyncResponse(BaseModel):
+    status: str
+    message: str
+    payload: Optional[dict]
+
+
+# -------------------------
+# WHATSAPP MODELS
+# -------------------------
+
+class WhatsAppMessagePayload(BaseModel):
+    mobile: str
+    message: str
+
+
+class WhatsAppTemplatePayload(BaseModel):
+    template_id: str
+    parameters: List[str]
+
+
+# -------------------------
+# UPLOAD MODELS
+# -------------------------
+
+class UploadSessionInit(BaseModel):
+    filename: str
+    size: int
+    sha256: str
+    chunk_size: Optional[int] = None
+
+
+# -------------------------
+# NOTIFICATION MODELS
+# -------------------------
+
+class NotificationMarkRead(BaseModel):
+    ids: Optional[List[int]] = None
+    up_to_id: Optional[int] = None
+    all: bool = False
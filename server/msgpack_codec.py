@@ -0,0 +1,170 @@
+# msgpack_codec.py
+"""
+MessagePack wire format for the sync endpoints.
+
+Clients opt in per request: `Content-Type: application/msgpack` for the
+body, `Accept: application/msgpack` for the response. JSON stays the
+default. Encoding rules (both directions):
+
+- datetime -> msgpack Timestamp (ext -1). Naive values are UTC, which
+  is how the server stores them; they decode as UTC-aware datetimes.
+- Decimal  -> ext type 1, payload = the decimal's string form (exact).
+- date     -> "YYYY-MM-DD" string; UUID -> string.
+"""
+
+import uuid
+import decimal
+import datetime
+import tempfile
+
+import msgpack
+import orjson
+from fastapi import Request, HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from starlette.responses import Response, StreamingResponse
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+EXT_DECIMAL = 1
+STREAM_BATCH_SIZE = 1000
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+SPOOL_READ_SIZE = 256 * 1024
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _default(obj):
+    # called once per non-native value, so exact type checks first
+    t = type(obj)
+    if t is datetime.datetime:
+        if obj.tzinfo is not None:
+            return obj  # packed natively (datetime=True)
+        d = obj - _EPOCH
+        return msgpack.Timestamp(d.days * 86400 + d.seconds, d.microseconds * 1000)
+    if t is decimal.Decimal:
+        return msgpack.ExtType(EXT_DECIMAL, str(obj).encode())
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, memoryview):
+        return bytes(obj)
+    raise TypeError(f"Type is not msgpack serializable: {type(obj).__name__}")
+
+
+def _ext_hook(code, data):
+    if code == EXT_DECIMAL:
+        return decimal.Decimal(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def packer() -> msgpack.Packer:
+    return msgpack.Packer(default=_default, use_bin_type=True, datetime=True)
+
+
+def packb(obj) -> bytes:
+    return msgpack.packb(obj, default=_default, use_bin_type=True, datetime=True)
+
+
+def unpackb(data: bytes):
+    return msgpack.unpackb(data, ext_hook=_ext_hook, timestamp=3, raw=False, strict_map_key=False)
+
+
+def is_msgpack(content_type: str) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() in MSGPACK_TYPES
+
+
+def _accept_q(accept: str) -> dict:
+    """
+    media type -> q-value from an Accept header (q defaults to 1).
+    """
+    out = {}
+    for part in accept.lower().split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        if not media:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        out[media] = max(q, out.get(media, 0.0))
+    return out
+
+
+def wants_msgpack(request: Request) -> bool:
+    """
+    True when the Accept header lists a MessagePack type with q > 0 that
+    is not ranked below application/json.
+    """
+    q = _accept_q(request.headers.get("accept", ""))
+    q_msgpack = max(q.get(t, 0.0) for t in MSGPACK_TYPES)
+    return q_msgpack > 0 and q_msgpack >= q.get("application/json", 0.0)
+
+
+class MsgpackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content) -> bytes:
+        return packb(content)
+
+
+def negotiated(request: Request, content):
+    """
+    Return `content` as MessagePack when the client asked for it,
+    unchanged (JSON) otherwise.
+    """
+    return MsgpackResponse(content) if wants_msgpack(request) else content
+
+
+def sync_body(model):
+    """
+    Dependency parsing the request body into `model` from JSON or
+    MessagePack, depending on Content-Type.
+    """
+    async def parse(request: Request):
+        raw = await request.body()
+        try:
+            if is_msgpack(request.headers.get("content-type")):
+                data = unpackb(raw) if raw else {}
+            else:
+                data = orjson.loads(raw) if raw else {}
+        except Exception:
+            raise HTTPException(400, "Malformed request body")
+        try:
+            return model.model_validate(data)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+    return parse
+
+
+def iter_msgpack_array(cur, transform=None, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    MessagePack array of the cursor's remaining rows. The array header
+    needs the row count up front, so rows are packed into a spool (in
+    memory up to SPOOL_MAX_MEMORY, then a temp file) while counting, and
+    the header and spooled bytes are sent once the cursor is exhausted.
+    """
+    p = packer()
+    count = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            spool.write(b"".join(p.pack(transform(r) if transform else r) for r in rows))
+            count += len(rows)
+        yield p.pack_array_header(count)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(SPOOL_READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def stream_msgpack(chunks, status_code: int = 200) -> StreamingResponse:
+    return StreamingResponse(chunks, status_code=status_code, media_type="application/msgpack")
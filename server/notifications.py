@@ -0,0 +1,132 @@
+# notifications.py
+"""
+Per-user notification fan-out for Server-Sent Event streams.
+
+An AFTER INSERT trigger on notifications (see init_db) NOTIFYs
+"notifications" with the new row, leaving out the message when it is too
+large for a NOTIFY payload. The pubsub listener thread hands each event
+to the asyncio queues of that user's open streams in this worker, so an
+idle stream costs no queries. After a listener reconnect, streams are
+told to resync, because events sent in between are lost.
+"""
+
+import json
+import asyncio
+import threading
+from collections import defaultdict
+
+from .db import get_conn
+from .pubsub import subscribe, on_reconnect
+
+CHANNEL = "notifications"
+STREAM_QUEUE_MAX = 1000
+REPLAY_MAX = 500
+RESYNC = object()  # queue marker: re-read from the database
+
+_streams = defaultdict(set)  # user_id -> {(loop, queue)}
+_lock = threading.Lock()
+
+
+def register(user_id: int) -> asyncio.Queue:
+    q = asyncio.Queue(maxsize=STREAM_QUEUE_MAX)
+    with _lock:
+        _streams[user_id].add((asyncio.get_running_loop(), q))
+    return q
+
+
+def unregister(user_id: int, q: asyncio.Queue):
+    with _lock:
+        subs = _streams.get(user_id)
+        if subs:
+            subs.difference_update({s for s in subs if s[1] is q})
+            if not subs:
+                del _streams[user_id]
+
+
+def open_streams() -> int:
+    with _lock:
+        return sum(len(s) for s in _streams.values())
+
+
+def _put(q: asyncio.Queue, item):
+    try:
+        q.put_nowait(item)
+    except asyncio.QueueFull:
+        # consumer far behind: drop queued events, it re-reads from the table
+        while not q.empty():
+            q.get_nowait()
+        q.put_nowait(RESYNC)
+
+
+def _deliver(targets, item):
+    for loop, q in targets:
+        try:
+            loop.call_soon_threadsafe(_put, q, item)
+        except RuntimeError:
+            pass  # loop closed
+
+
+def _on_notify(payload: str):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return
+    with _lock:
+        targets = list(_streams.get(event.get("user_id"), ()))
+    _deliver(targets, event)
+
+
+def _on_reconnect():
+    with _lock:
+        targets = [s for subs in _streams.values() for s in subs]
+    _deliver(targets, RESYNC)
+
+
+def fetch_since(user_id: int, after_id: int, limit: int = REPLAY_MAX) -> list:
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT id, user_id, message, is_read, created_at FROM notifications"
+            " WHERE user_id = %s AND id > %s ORDER BY id LIMIT %s",
+            (user_id, after_id, limit),
+        )
+        return cur.fetchall()
+    finally:
+        cur.close(); conn.close()
+
+
+def fetch_message(notification_id: int):
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("SELECT message FROM notifications WHERE id = %s", (notification_id,))
+        row = cur.fetchone()
+        return row["message"] if row else None
+    finally:
+        cur.close(); conn.close()
+
+
+def mark_read(user_id: int, ids: list = None, up_to_id: int = None) -> int:
+    """
+    Mark the given ids, or everything up to up_to_id, or (neither given)
+    all of the user's notifications as read. Returns rows changed.
+    """
+    where, args = ["user_id = %s", "NOT is_read"], [user_id]
+    if ids:
+        where.append("id = ANY(%s)"); args.append(list(ids))
+    if up_to_id is not None:
+        where.append("id <= %s"); args.append(up_to_id)
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute(f"UPDATE notifications SET is_read = TRUE WHERE {' AND '.join(where)}", args)
+        n = cur.rowcount
+        conn.commit()
+        return n
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close(); conn.close()
+
+
+subscribe(CHANNEL, _on_notify)
+on_reconnect(_on_reconnect)
@@ -0,0 +1,126 @@
+# notifications_router.py
+from fastapi import APIRouter, Depends, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+from typing import Optional
+from .dependencies import get_current_user
+from .models import NotificationMarkRead
+from . import notifications
+import asyncio
+import datetime
+import json
+import os
+
+router = APIRouter()
+
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_RETRY_MS = 5000
+
+
+def _user_id(current_user: dict) -> int:
+    uid = current_user.get("user_id")
+    if uid is None:
+        raise HTTPException(401, "Token has no user_id")
+    return int(uid)
+
+
+def _iso(value):
+    """
+    ISO 8601 for created_at, whether it came from a query (datetime) or
+    from the NOTIFY payload (Postgres JSON text, fractional digits trimmed).
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value.isoformat() if value is not None else None
+
+
+def _event(row) -> bytes:
+    data = json.dumps({
+        "id": row["id"],
+        "message": row["message"],
+        "is_read": bool(row.get("is_read")),
+        "created_at": _iso(row.get("created_at")),
+    })
+    return f"id: {row['id']}\nevent: notification\ndata: {data}\n\n".encode()
+
+
+async def _event_stream(request: Request, user_id: int, last_id: int):
+    # register before reading the backlog so nothing inserted meanwhile is missed
+    q = notifications.register(user_id)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        resync = last_id > 0
+        while True:
+            if resync:
+                resync = False
+                rows = await run_in_threadpool(notifications.fetch_since, user_id, last_id)
+                for row in rows:
+                    yield _event(row)
+                    last_id = row["id"]
+                if len(rows) == notifications.REPLAY_MAX:
+                    resync = True  # more backlog; keep going
+                    continue
+            try:
+                item = await asyncio.wait_for(q.get(), SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": ping\n\n"
+                continue
+            if item is notifications.RESYNC:
+                resync = True
+                continue
+            if item["id"] <= last_id:
+                continue  # already sent from the backlog
+            if item.get("message") is None:
+                item["message"] = await run_in_threadpool(notifications.fetch_message, item["id"])
+            yield _event(item)
+            last_id = item["id"]
+    finally:
+        notifications.unregister(user_id, q)
+
+
+@router.get("/stream")
+async def notification_stream(
+    request: Request,
+    last_event_id: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Server-Sent Events stream of the caller's new notifications.
+    Reconnecting clients send Last-Event-ID (or ?last_event_id=) and get
+    everything after it first. Comment heartbeats keep proxies from
+    closing idle streams.
+    """
+    user_id = _user_id(current_user)
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    return StreamingResponse(
+        _event_stream(request, user_id, last_event_id or 0),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("")
+def list_notifications(after_id: int = 0, limit: int = 100, current_user: dict = Depends(get_current_user)):
+    """
+    The caller's notifications after `after_id`, oldest first.
+    """
+    limit = max(1, min(limit, notifications.REPLAY_MAX))
+    return {"items": notifications.fetch_since(_user_id(current_user), after_id, limit)}
+
+
+@router.post("/mark_read")
+def mark_notifications_read(payload: NotificationMarkRead, current_user: dict = Depends(get_current_user)):
+    """
+    Bulk mark-read: {"ids": [...]}, {"up_to_id": n}, or {"all": true}.
+    """
+    if not (payload.ids or payload.up_to_id is not None or payload.all):
+        raise HTTPException(400, "Give ids, up_to_id or all=true")
+    n = notifications.mark_read(_user_id(current_user), payload.ids, payload.up_to_id)
+    return {"updated": n}
@@ -0,0 +1,246 @@
+# partner_counters.py
+"""
+Contention-free partner counters.
+
+Sync pushes append one row per increment to d2na_partner_counter_deltas
+instead of updating the shared d2na_partners row, so concurrent agents
+of the same partner never queue on its row lock. A background job
+folds the deltas into d2na_partners in batches; reads add the
+still-pending deltas in the same statement so counts stay exact.
+
+The same merge maintains partner_daily_stats (per partner, per activity
+day), which backs the performance leaderboard without scanning
+pan_records / kotak_records.
+"""
+
+import os
+import datetime
+
+from .db import get_conn
+
+MERGE_INTERVAL_SECONDS = int(os.environ.get("PARTNER_COUNTER_MERGE_SECONDS", "30"))
+MERGE_BATCH_SIZE = 5000
+
+# counter columns bumped per synced table
+COUNTER_TABLES = {
+    "pan_records": "pan_delta",
+    "kotak_records": "kotak_delta",
+}
+
+# join this onto d2na_partners p to get pending_* columns; the LATERAL
+# subquery sums only the deltas of rows the outer query actually returns
+PENDING_JOIN_SQL = """
+    LEFT JOIN LATERAL (
+        SELECT SUM(d.pan_delta) AS pending_pan,
+               SUM(d.kotak_delta) AS pending_kotak,
+               SUM(d.total_delta) AS pending_total
+        FROM d2na_partner_counter_deltas d
+        WHERE d.partner_code = p.partner_code
+    ) pending ON TRUE
+"""
+PENDING_COLUMNS_SQL = "pending.pending_pan, pending.pending_kotak, pending.pending_total"
+
+
+# leaderboard metric -> (partner_daily_stats column, delta column)
+METRICS = {
+    "pan_count": ("pan_count", "pan_delta"),
+    "kotak_count": ("kotak_count", "kotak_delta"),
+    "total_transactions": ("total_transactions", "total_delta"),
+}
+
+
+def _activity_date(created):
+    # the record's own created_at decides its day; desktops may sync late
+    try:
+        return datetime.datetime.fromisoformat(str(created)[:19]).date()
+    except (TypeError, ValueError):
+        return datetime.datetime.utcnow().date()
+
+
+def record_increment(cur, table: str, partner_code: str, created=None):
+    """
+    Append a +1 delta for a record pushed into `table`, on the caller's
+    transaction. No-op for tables without partner counters.
+    """
+    col = COUNTER_TABLES.get(table)
+    if not col or not partner_code:
+        return
+    cur.execute(
+        f"INSERT INTO d2na_partner_counter_deltas (partner_code, {col}, total_delta, activity_date) VALUES (%s, 1, 1, %s)",
+        (partner_code, _activity_date(created)),
+    )
+
+
+def apply_pending(row: dict) -> dict:
+    """
+    Fold the pending_* columns selected via PENDING_JOIN_SQL into the
+    row's pan_count / kotak_count / total_transactions.
+    """
+    for counter, pending in (("pan_count", "pending_pan"), ("kotak_count", "pending_kotak"), ("total_transactions", "pending_total")):
+        extra = row.pop(pending, None)
+        if counter in row and extra:
+            row[counter] = (row[counter] or 0) + int(extra)
+    return row
+
+
+def merge_counter_deltas(batch_size: int = MERGE_BATCH_SIZE) -> dict:
+    """
+    Move pending deltas into d2na_partners and partner_daily_stats, one
+    batch per transaction. Each batch takes every partner row lock once,
+    instead of once per record.
+    """
+    merged = 0
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        while True:
+            cur.execute(
+                """
+                WITH moved AS (
+                    DELETE FROM d2na_partner_counter_deltas WHERE id IN (
+                        SELECT id FROM d2na_partner_counter_deltas
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING partner_code, pan_delta, kotak_delta, total_delta, activity_date
+                ), daily AS (
+                    INSERT INTO partner_daily_stats AS s (partner_code, day, pan_count, kotak_count, total_transactions)
+                    SELECT partner_code, activity_date, SUM(pan_delta), SUM(kotak_delta), SUM(total_delta)
+                    FROM moved
+                    GROUP BY partner_code, activity_date
+                    ON CONFLICT (partner_code, day) DO UPDATE SET
+                        pan_count = s.pan_count + excluded.pan_count,
+                        kotak_count = s.kotak_count + excluded.kotak_count,
+                        total_transactions = s.total_transactions + excluded.total_transactions
+                ), agg AS (
+                    SELECT partner_code,
+                           SUM(pan_delta) AS pan,
+                           SUM(kotak_delta) AS kotak,
+                           SUM(total_delta) AS total,
+                           COUNT(*) AS n
+                    FROM moved
+                    GROUP BY partner_code
+                ), upd AS (
+                    UPDATE d2na_partners p SET
+                        pan_count = COALESCE(p.pan_count,0) + agg.pan,
+                        kotak_count = COALESCE(p.kotak_count,0) + agg.kotak,
+                        total_transactions = COALESCE(p.total_transactions,0) + agg.total,
+                        last_update = %s
+                    FROM agg
+                    WHERE p.partner_code = agg.partner_code
+                )
+                SELECT COALESCE(SUM(n), 0) AS n FROM agg
+                """,
+                (batch_size, datetime.datetime.utcnow().isoformat()),
+            )
+            n = int(cur.fetchone()["n"])
+            conn.commit()
+            merged += n
+            if n < batch_size:
+                break
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return {"rows": merged}
+
+
+def leaderboard(metric: str, start: datetime.date, end: datetime.date, limit: int = 10) -> list:
+    """
+    Top partners by `metric` between start and end (inclusive), counting
+    merged daily stats plus pending deltas.
+    """
+    stat_col, delta_col = METRICS[metric]
+    conn = get_conn(readonly=True); cur = conn.cursor()
+    try:
+        cur.execute(
+            f"""
+            SELECT t.partner_code, p.partner_name, SUM(t.v)::bigint AS value
+            FROM (
+                SELECT partner_code, {stat_col} AS v FROM partner_daily_stats WHERE day BETWEEN %s AND %s
+                UNION ALL
+                SELECT partner_code, {delta_col} FROM d2na_partner_counter_deltas WHERE activity_date BETWEEN %s AND %s
+            ) t
+            LEFT JOIN d2na_partners p ON p.partner_code = t.partner_code
+            GROUP BY t.partner_code, p.partner_name
+            ORDER BY value DESC, t.partner_code
+            LIMIT %s
+            """,
+            (start, end, start, end, limit),
+        )
+        return [dict(r) for r in cur.fetchall()]
+    finally:
+        cur.close(); conn.close()
+
+
+def partner_daily(partner_code: str, start: datetime.date, end: datetime.date) -> list:
+    """
+    Per-day counters for one partner between start and end (inclusive).
+    """
+    conn = get_conn(readonly=True); cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            SELECT day, SUM(pan_count)::bigint AS pan_count, SUM(kotak_count)::bigint AS kotak_count,
+                   SUM(total_transactions)::bigint AS total_transactions
+            FROM (
+                SELECT day, pan_count, kotak_count, total_transactions
+                FROM partner_daily_stats WHERE partner_code = %s AND day BETWEEN %s AND %s
+                UNION ALL
+                SELECT activity_date, pan_delta, kotak_delta, total_delta
+                FROM d2na_partner_counter_deltas WHERE partner_code = %s AND activity_date BETWEEN %s AND %s
+            ) t
+            GROUP BY day
+            ORDER BY day
+            """,
+            (partner_code, start, end, partner_code, start, end),
+        )
+        return [dict(r) for r in cur.fetchall()]
+    finally:
+        cur.close(); conn.close()
+
+
+def rebuild_daily_stats() -> dict:
+    """
+    Recompute partner_daily_stats from pan_records / kotak_records (for
+    history recorded before the daily table existed). Pending deltas are
+    subtracted so the next merge does not count them twice; the delta
+    table is locked against new pushes for the duration.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("LOCK TABLE d2na_partner_counter_deltas IN EXCLUSIVE MODE")
+        cur.execute("TRUNCATE partner_daily_stats")
+        cur.execute("""
+            INSERT INTO partner_daily_stats (partner_code, day, pan_count, kotak_count, total_transactions)
+            SELECT agent_code, day, SUM(pan), SUM(kotak), SUM(pan + kotak)
+            FROM (
+                SELECT agent_code, created_at::date AS day, 1 AS pan, 0 AS kotak FROM pan_records WHERE agent_code IS NOT NULL AND agent_code <> ''
+                UNION ALL
+                SELECT agent_code, created_at::date, 0, 1 FROM kotak_records WHERE agent_code IS NOT NULL AND agent_code <> ''
+            ) r
+            GROUP BY agent_code, day
+        """)
+        cur.execute("""
+            UPDATE partner_daily_stats s SET
+                pan_count = s.pan_count - d.pan,
+                kotak_count = s.kotak_count - d.kotak,
+                total_transactions = s.total_transactions - d.total
+            FROM (
+                SELECT partner_code, activity_date, SUM(pan_delta) AS pan, SUM(kotak_delta) AS kotak, SUM(total_delta) AS total
+                FROM d2na_partner_counter_deltas
+                GROUP BY partner_code, activity_date
+            ) d
+            WHERE s.partner_code = d.partner_code AND s.day = d.activity_date
+        """)
+        cur.execute("SELECT COUNT(*) AS n FROM partner_daily_stats")
+        n = cur.fetchone()["n"]
+        conn.commit()
+        return {"rows": n}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close(); conn.close()
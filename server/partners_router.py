@@ -1,28 +1,363 @@
-# partners_router.py
-from fastapi import APIRouter, Depends
-from .db import get_conn
-import datetime
-
-router = APIRouter()
-
-@router.get("/partners")
-def list_partners(current_user: dict = Depends(lambda: None)):
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM d2na_partners ORDER BY partner_code")
-    rows = cur.fetchall(); conn.close()
-    return [dict(r) for r in rows]
-
-@router.post("/partners/upsert")
-def upsert_partner(payload: dict, current_user: dict = Depends(lambda: None)):
-    code = payload.get('partner_code')
-    name = payload.get('partner_name')
-    login = payload.get('login_id')
-    mobile = payload.get('mobile')
-    now = datetime.datetime.utcnow().isoformat()
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("INSERT INTO d2na_partners(partner_code, partner_name, login_id, mobile, last_update) VALUES(?,?,?,?,?) ON CONFLICT(partner_code) DO UPDATE SET partner_name=excluded.partner_name, login_id=excluded.login_id, mobile=excluded.mobile, last_update=excluded.last_update",
-                (code, name, login, mobile, now))
-    conn.commit(); conn.close()
-    return {"status":"ok"}
-
-
+# partners_router.py
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from typing import Optional
+from .db import get_conn
+from .partner_counters import (
+    PENDING_JOIN_SQL,
+    PENDING_COLUMNS_SQL,
+    METRICS,
+    apply_pending,
+    leaderboard,
+    partner_daily,
+    rebuild_daily_stats,
+)
+from .dependencies import require_role
+from . import audit
+from .fastjson import ORJSONResponse
+from .utils import etag_matches
+from starlette.concurrency import run_in_threadpool
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import psycopg2
+
+router = APIRouter()
+
+PARTNER_FIELDS = ("partner_code", "partner_name", "login_id", "mobile", "last_update",
+                  "pan_count", "kotak_count", "total_transactions")
+COUNTER_FIELDS = ("pan_count", "kotak_count", "total_transactions")
+PARTNER_PAGE_DEFAULT = 500
+PARTNER_PAGE_MAX = 2000
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _partners_etag(cur, params: tuple) -> str:
+    # newest last_update + newest pending counter delta identify the data version
+    cur.execute("""
+        SELECT (SELECT MAX(last_update) FROM d2na_partners) AS last_update,
+               (SELECT MAX(id) FROM d2na_partner_counter_deltas) AS last_delta
+    """)
+    row = cur.fetchone()
+    raw = repr((str(row["last_update"]), row["last_delta"]) + params)
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+
+
+@router.get("/partners")
+def list_partners(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = PARTNER_PAGE_DEFAULT,
+    name: Optional[str] = None,
+    mobile_prefix: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(lambda: None),
+):
+    """
+    Keyset-paginated partner list ordered by partner_code.
+    - after=<partner_code> continues from the X-Next-After header of the previous page
+    - name filters by substring (case-insensitive), mobile_prefix by prefix
+    - fields=a,b,c limits the returned columns (partner_code is always included)
+    Responses carry an ETag; If-None-Match returns 304 while nothing changed.
+    """
+    limit = max(1, min(limit, PARTNER_PAGE_MAX))
+    if fields:
+        wanted = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in wanted if f not in PARTNER_FIELDS]
+        if unknown:
+            raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+        cols = ["partner_code"] + [f for f in wanted if f != "partner_code"]
+        select = ", ".join(f"p.{c}" for c in cols)
+        with_counters = any(c in COUNTER_FIELDS for c in cols)
+    else:
+        select = "p.*"
+        with_counters = True
+
+    where, args = [], []
+    if after:
+        where.append("p.partner_code > %s"); args.append(after)
+    if name:
+        where.append("p.partner_name ILIKE %s"); args.append(f"%{_like_escape(name)}%")
+    if mobile_prefix:
+        where.append("p.mobile LIKE %s"); args.append(f"{_like_escape(mobile_prefix)}%")
+
+    sql = f"SELECT {select}"
+    if with_counters:
+        # counters = merged value + deltas not yet merged (one statement, one snapshot)
+        sql += f", {PENDING_COLUMNS_SQL} FROM d2na_partners p {PENDING_JOIN_SQL}"
+    else:
+        sql += " FROM d2na_partners p"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY p.partner_code LIMIT %s"
+
+    conn = get_conn(readonly=True); cur = conn.cursor()
+    try:
+        etag = _partners_etag(cur, (after, limit, name, mobile_prefix, fields))
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        cur.execute(sql, args + [limit])
+        rows = cur.fetchall()
+    finally:
+        cur.close(); conn.close()
+
+    for r in rows:
+        apply_pending(r)  # RealDictRow, folded in place
+    if len(rows) == limit:
+        headers["X-Next-After"] = rows[-1]["partner_code"]
+    return ORJSONResponse(rows, headers=headers)
+
+@router.post("/partners/upsert")
+def upsert_partner(payload: dict, current_user: dict = Depends(lambda: None)):
+    code = payload.get('partner_code')
+    name = payload.get('partner_name')
+    login = payload.get('login_id')
+    mobile = payload.get('mobile')
+    now = datetime.datetime.utcnow().isoformat()
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute("INSERT INTO d2na_partners(partner_code, partner_name, login_id, mobile, last_update) VALUES(?,?,?,?,?) ON CONFLICT(partner_code) DO UPDATE SET partner_name=excluded.partner_name, login_id=excluded.login_id, mobile=excluded.mobile, last_update=excluded.last_update",
+                (code, name, login, mobile, now))
+    conn.commit(); conn.close()
+    return {"status":"ok"}
+
+
+# -------------------------
+# BULK IMPORT
+# -------------------------
+PARTNER_IMPORT_COLUMNS = ("partner_code", "partner_name", "login_id", "mobile")
+BULK_MAX_ROWS = int(os.environ.get("PARTNER_BULK_MAX_ROWS", "50000"))
+BULK_MAX_ERRORS = 1000
+MOBILE_RE = re.compile(r"^\+?\d{7,15}$")
+
+
+def _validate_partner_rows(records):
+    """
+    Normalise rows and split them into (accepted, errors, duplicates).
+    Row numbers are 1-based positions in the upload; a later duplicate
+    partner_code wins and the earlier row is listed in duplicates.
+    """
+    accepted, errors, duplicates = {}, [], []
+    for row_no, rec in enumerate(records, start=1):
+        if not isinstance(rec, dict):
+            errors.append({"row": row_no, "partner_code": None, "error": "row must be an object"})
+            continue
+        vals = {c: (str(rec[c]).strip() if rec.get(c) not in (None, "") else None) for c in PARTNER_IMPORT_COLUMNS}
+        code = vals["partner_code"]
+        if not code:
+            errors.append({"row": row_no, "partner_code": None, "error": "partner_code required"})
+            continue
+        if vals["mobile"]:
+            vals["mobile"] = vals["mobile"].replace(" ", "").replace("-", "")
+            if not MOBILE_RE.match(vals["mobile"]):
+                errors.append({"row": row_no, "partner_code": code, "error": "invalid mobile"})
+                continue
+        if code in accepted:
+            duplicates.append({"row": accepted[code][0], "partner_code": code, "replaced_by_row": row_no})
+        accepted[code] = (row_no, vals)
+    return list(accepted.values()), errors, duplicates
+
+
+PARTNER_MERGE_SQL = """
+    INSERT INTO d2na_partners (partner_code, partner_name, login_id, mobile, last_update)
+    {source}
+    ON CONFLICT (partner_code) DO UPDATE SET
+        partner_name = COALESCE(excluded.partner_name, d2na_partners.partner_name),
+        login_id = COALESCE(excluded.login_id, d2na_partners.login_id),
+        mobile = COALESCE(excluded.mobile, d2na_partners.mobile),
+        last_update = excluded.last_update
+    RETURNING (xmax = 0) AS inserted
+"""
+
+
+def _merge_rows_one_by_one(cur, accepted, now: str):
+    """
+    Fallback when the batch merge fails: merge each row under its own
+    savepoint so the rows the database rejects are reported by row_no
+    and the rest still go in.
+    """
+    counts, errors = {"inserted": 0, "updated": 0}, []
+    sql = PARTNER_MERGE_SQL.format(source="VALUES (%s, %s, %s, %s, %s)")
+    for row_no, vals in accepted:
+        cur.execute("SAVEPOINT partner_row")
+        try:
+            cur.execute(sql, [vals[c] for c in PARTNER_IMPORT_COLUMNS] + [now])
+            counts["inserted" if cur.fetchone()["inserted"] else "updated"] += 1
+            cur.execute("RELEASE SAVEPOINT partner_row")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT partner_row")
+            msg = str(e).strip()
+            errors.append({"row": row_no, "partner_code": vals["partner_code"],
+                           "error": msg.splitlines()[0] if msg else type(e).__name__})
+    return counts, errors
+
+
+def _bulk_merge_partners(accepted):
+    """
+    COPY accepted rows into a temp staging table and merge them into
+    d2na_partners with one INSERT ... ON CONFLICT. Columns left empty in
+    the upload keep their current value. If the database rejects the
+    batch (constraint or type error on some row), the rows are merged one
+    by one instead. Returns (counts, per-row database errors).
+    """
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for row_no, vals in accepted:
+        w.writerow([row_no] + [vals[c] for c in PARTNER_IMPORT_COLUMNS])
+    buf.seek(0)
+    now = datetime.datetime.utcnow().isoformat()
+
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE partners_stage (
+                row_no INTEGER,
+                partner_code TEXT,
+                partner_name TEXT,
+                login_id TEXT,
+                mobile TEXT
+            ) ON COMMIT DROP
+        """)
+        cur.copy_expert("COPY partners_stage FROM STDIN WITH (FORMAT csv)", buf)
+        cur.execute("SAVEPOINT partners_batch")
+        try:
+            merge = PARTNER_MERGE_SQL.format(
+                source="SELECT partner_code, partner_name, login_id, mobile, %s FROM partners_stage ORDER BY row_no"
+            )
+            cur.execute(f"""
+                WITH up AS ({merge})
+                SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+                       COUNT(*) FILTER (WHERE NOT inserted) AS updated
+                FROM up
+            """, (now,))
+            counts, errors = dict(cur.fetchone()), []
+        except psycopg2.Error:
+            cur.execute("ROLLBACK TO SAVEPOINT partners_batch")
+            counts, errors = _merge_rows_one_by_one(cur, accepted, now)
+        conn.commit()
+        return counts, errors
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close(); conn.close()
+
+
+def _read_csv_records(raw: bytes):
+    text = raw.decode("utf-8-sig")
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+@router.post("/partners/bulk_upsert")
+async def bulk_upsert_partners(request: Request, current_user: dict = Depends(require_role("ADMIN"))):
+    """
+    Bulk insert/update partners.
+    Accepts a JSON array of partner objects, a text/csv body, or a
+    multipart upload with a `file` field (CSV with a header row).
+    Columns: partner_code (required), partner_name, login_id, mobile.
+    Returns inserted/updated/rejected counts, per-row errors (validation
+    and database) and the rows superseded by a later duplicate.
+    """
+    ctype = request.headers.get("content-type", "")
+    try:
+        if ctype.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(400, "multipart upload needs a `file` field")
+            records = _read_csv_records(await upload.read())
+        elif ctype.startswith("text/csv"):
+            records = _read_csv_records(await request.body())
+        else:
+            records = json.loads(await request.body() or b"[]")
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(400, f"Could not parse upload: {e}")
+    if not isinstance(records, list):
+        raise HTTPException(400, "Expected a JSON array of partners")
+    if len(records) > BULK_MAX_ROWS:
+        raise HTTPException(413, f"Too many rows. Max {BULK_MAX_ROWS} per upload.")
+
+    accepted, errors, duplicates = _validate_partner_rows(records)
+    counts = {"inserted": 0, "updated": 0}
+    if accepted:
+        try:
+            counts, db_errors = await run_in_threadpool(_bulk_merge_partners, accepted)
+        except Exception as e:
+            raise HTTPException(500, f"Database error: {e}")
+        errors = sorted(errors + db_errors, key=lambda e: e["row"])
+        audit.log_admin_action(current_user, request, "partners_bulk_upsert", "d2na_partners",
+                                {"received": len(records), **counts, "rejected": len(errors)})
+    return {
+        "status": "ok",
+        "received": len(records),
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "rejected": len(errors),
+        "errors": errors[:BULK_MAX_ERRORS],
+        "duplicates": len(duplicates),
+        "duplicate_rows": duplicates[:BULK_MAX_ERRORS],
+    }
+
+
+# -------------------------
+# PERFORMANCE DASHBOARD
+# -------------------------
+LEADERBOARD_DEFAULT_DAYS = 30
+LEADERBOARD_MAX_LIMIT = 100
+
+
+def _period(start: Optional[datetime.date], end: Optional[datetime.date]):
+    end = end or datetime.datetime.utcnow().date()
+    start = start or end - datetime.timedelta(days=LEADERBOARD_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(400, "start must not be after end")
+    return start, end
+
+
+@router.get("/partners/leaderboard")
+def partner_leaderboard(
+    metric: str = "total_transactions",
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    limit: int = 10,
+    current_user: dict = Depends(lambda: None),
+):
+    """
+    Top-N partners by pan_count, kotak_count or total_transactions over
+    [start, end] (default: last 30 days), from per-partner daily aggregates.
+    """
+    if metric not in METRICS:
+        raise HTTPException(400, f"metric must be one of: {', '.join(METRICS)}")
+    start, end = _period(start, end)
+    limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+    return {"metric": metric, "start": start, "end": end, "items": leaderboard(metric, start, end, limit)}
+
+
+@router.get("/partners/{partner_code}/daily")
+def partner_daily_stats(
+    partner_code: str,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    current_user: dict = Depends(lambda: None),
+):
+    start, end = _period(start, end)
+    return {"partner_code": partner_code, "start": start, "end": end, "days": partner_daily(partner_code, start, end)}
+
+
+@router.post("/partners/leaderboard/rebuild")
+def rebuild_leaderboard(request: Request, current_user: dict = Depends(require_role("ADMIN"))):
+    """
+    Recompute the daily aggregates from the record tables (one-off backfill).
+    """
+    try:
+        result = rebuild_daily_stats()
+    except Exception as e:
+        raise HTTPException(500, f"Database error: {e}")
+    audit.log_admin_action(current_user, request, "rebuild_leaderboard", "partner_daily_stats", result)
+    return {"status": "ok", **result}
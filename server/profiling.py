@@ -0,0 +1,140 @@
+# profiling.py
+"""
+Opt-in per-request SQL profiling.
+
+With SQL_PROFILING=1, ProfilingMiddleware attaches a RequestProfile to
+a context variable for each request. TimedCursor and get_conn() report
+into it. The profile is also visible inside sync handlers, because the
+threadpool copies the context. Every response gets a Server-Timing header
+(db time, query count, connections). Requests slower than
+SLOW_REQUEST_MS are logged as one JSON line with their statements
+normalized and grouped, so an N+1 loop shows up as one statement with a
+high count.
+"""
+
+import os
+import re
+import json
+import time
+import contextvars
+
+SQL_PROFILING = os.environ.get("SQL_PROFILING", "0").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+SLOW_LOG_TOP = 10
+
+_current = contextvars.ContextVar("request_profile", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql) -> str:
+    """
+    Strip literals and parameters so the same statement with different
+    values groups together: "SELECT * FROM t WHERE id = ?".
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    sql = _STRING.sub("?", str(sql))
+    sql = _PARAM.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class RequestProfile:
+    __slots__ = ("queries", "db_seconds", "connections", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.connections = 0
+        self.statements = {}  # raw sql -> [count, seconds]; normalized only when logged
+
+    def top_statements(self, n: int = SLOW_LOG_TOP) -> list:
+        grouped = {}
+        for sql, (count, seconds) in self.statements.items():
+            g = grouped.setdefault(normalize_sql(sql), [0, 0.0])
+            g[0] += count
+            g[1] += seconds
+        ranked = sorted(grouped.items(), key=lambda kv: (kv[1][0], kv[1][1]), reverse=True)
+        return [{"sql": sql, "count": c, "ms": round(s * 1000, 2)} for sql, (c, s) in ranked[:n]]
+
+
+def record_query(sql, seconds: float):
+    profile = _current.get()
+    if profile is None:
+        return
+    profile.queries += 1
+    profile.db_seconds += seconds
+    if not isinstance(sql, (str, bytes)):
+        sql = str(sql)  # psycopg2.sql.Composed is unhashable
+    s = profile.statements.get(sql)
+    if s is None:
+        profile.statements[sql] = [1, seconds]
+    else:
+        s[0] += 1
+        s[1] += seconds
+
+
+def record_connection():
+    profile = _current.get()
+    if profile is not None:
+        profile.connections += 1
+
+
+def server_timing(profile: RequestProfile, total_seconds: float) -> str:
+    return (
+        f'db;dur={profile.db_seconds * 1000:.1f};desc="{profile.queries} queries", '
+        f'conn;desc="{profile.connections} connections", '
+        f"app;dur={total_seconds * 1000:.1f}"
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware. Does nothing unless SQL_PROFILING is enabled.
+    """
+
+    def __init__(self, app, slow_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if not SQL_PROFILING or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(profile, time.perf_counter() - start).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms >= self.slow_ms:
+                route = scope.get("route")
+                print(json.dumps({
+                    "event": "slow_request",
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "route": getattr(route, "path", None),
+                    "status": status[0],
+                    "ms": round(elapsed_ms, 1),
+                    "db_ms": round(profile.db_seconds * 1000, 1),
+                    "queries": profile.queries,
+                    "connections": profile.connections,
+                    "statements": profile.top_statements(),
+                }))
@@ -0,0 +1,100 @@
+# pubsub.py
+"""
+Postgres LISTEN/NOTIFY fan-out for this worker process.
+
+One daemon thread holds a dedicated (unpooled) autocommit connection,
+LISTENs on every subscribed channel and calls the registered callbacks
+with the notification payload. If the connection drops, the thread reconnects
+and calls the on_reconnect hooks, since notifications sent in between
+are lost.
+"""
+
+import select
+import threading
+from collections import defaultdict
+
+import psycopg2.extensions
+
+from .db import connect
+
+_callbacks = defaultdict(list)
+_reconnect_hooks = []
+_stop = threading.Event()
+_thread = None
+_lock = threading.Lock()
+
+
+def subscribe(channel: str, callback):
+    """
+    Call callback(payload) for every NOTIFY on `channel`.
+    """
+    with _lock:
+        _callbacks[channel].append(callback)
+
+
+def on_reconnect(hook):
+    _reconnect_hooks.append(hook)
+
+
+def notify(cur, channel: str, payload: str = ""):
+    """
+    Queue a notification on the caller's transaction; it is delivered on commit.
+    """
+    cur.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+
+
+def _dispatch(channel: str, payload: str):
+    for cb in list(_callbacks.get(channel, ())):
+        try:
+            cb(payload)
+        except Exception as e:
+            print(f"pubsub callback for {channel} failed:", e)
+
+
+def _listen_loop():
+    first = True
+    while not _stop.is_set():
+        conn = None
+        try:
+            conn = connect()
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            listening = set()
+            if not first:
+                for hook in list(_reconnect_hooks):
+                    hook()
+            first = False
+            while not _stop.is_set():
+                with _lock:
+                    pending = [c for c in _callbacks if c not in listening]
+                for channel in pending:
+                    cur.execute(f'LISTEN "{channel}"')
+                    listening.add(channel)
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    n = conn.notifies.pop(0)
+                    _dispatch(n.channel, n.payload)
+        except Exception as e:
+            print("pubsub listener error, reconnecting:", e)
+            _stop.wait(2)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def start_listener():
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_listen_loop, name="pg-listener", daemon=True)
+    _thread.start()
+
+
+def stop_listener():
+    _stop.set()
@@ -0,0 +1,96 @@
+# read_your_writes.py
+"""
+Read-your-writes window for replica routing.
+
+After a user's successful write request (POST/PUT/PATCH/DELETE below
+400, except READ_ONLY_PATHS), their readonly queries go to the primary for
+READ_YOUR_WRITES_SECONDS, so a replica that has not replayed the write
+yet cannot hide it from them. The window is kept in this worker's memory
+and in an `rw_until` cookie, so it also holds when the next request
+lands on another worker. Inactive unless DATABASE_REPLICA_URLS is set.
+"""
+
+import os
+import json
+import time
+import base64
+
+from .db import DATABASE_REPLICA_URLS, primary_only
+
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "15"))
+COOKIE_NAME = "rw_until"
+_WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# POST endpoints that only read; they must not pin the caller to the primary
+READ_ONLY_PATHS = {"/sync/sync/pull"}
+_MAX_TRACKED = 50000
+
+_recent_writes = {}  # user key -> epoch seconds until which reads use the primary
+
+
+def _user_key(headers: dict):
+    """
+    Subject of the bearer token, used only to group requests (routing,
+    not auth), so the signature is not verified here.
+    """
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth.lower().startswith("bearer "):
+        return None
+    try:
+        part = auth.split(None, 1)[1].split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(part + "=" * (-len(part) % 4)))
+        return str(claims.get("sub") or claims.get("user_id") or "") or None
+    except Exception:
+        return None
+
+
+def _cookie_until(headers: dict) -> float:
+    for item in headers.get(b"cookie", b"").decode("latin-1").split(";"):
+        name, _, value = item.strip().partition("=")
+        if name == COOKIE_NAME:
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 0.0
+
+
+def _remember(key: str, until: float):
+    if len(_recent_writes) >= _MAX_TRACKED:
+        now = time.time()
+        for k in [k for k, v in _recent_writes.items() if v < now]:
+            del _recent_writes[k]
+    _recent_writes[key] = until
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pure ASGI middleware; sets db.primary_only for the request.
+    """
+
+    def __init__(self, app, window: float = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not DATABASE_REPLICA_URLS:
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers", []))
+        key = _user_key(headers)
+        now = time.time()
+        pinned = _cookie_until(headers) > now or (key is not None and _recent_writes.get(key, 0) > now)
+        is_write = scope.get("method") in _WRITE_METHODS and scope.get("path") not in READ_ONLY_PATHS
+
+        async def send_wrapper(message):
+            if is_write and message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + self.window
+                if key is not None:
+                    _remember(key, until)
+                cookie = f"{COOKIE_NAME}={until:.0f}; Max-Age={int(self.window)}; Path=/; HttpOnly; SameSite=Lax"
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        token = primary_only.set(pinned)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            primary_only.reset(token)
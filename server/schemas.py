@@ -1,5 +1,5 @@
-# server/schemas.py
-from pydantic import BaseModel
-
-class MessageResponse(BaseModel):
-    message: str
+# server/schemas.py
+from pydantic import BaseModel
+
+class MessageResponse(BaseModel):
+    message: str
@@ -0,0 +1,94 @@
+# settings_cache.py
+"""
+Read-through cache for app_settings.
+
+Values are kept parsed (json.loads already applied) per worker. A write
+invalidates the local entry and NOTIFYs other workers on
+`app_settings_changed`; the TTL bounds staleness if a notification is
+ever missed. Cached values are shared - treat them as read-only.
+"""
+
+import os
+import json
+import time
+import threading
+
+from .db import get_conn
+from .pubsub import subscribe, on_reconnect, notify
+
+SETTINGS_CACHE_TTL = float(os.environ.get("SETTINGS_CACHE_TTL", "300"))
+CHANNEL = "app_settings_changed"
+
+_cache = {}
+_lock = threading.Lock()
+_generation = 0
+
+
+def _parse(raw):
+    try:
+        return json.loads(raw)
+    except Exception:
+        return raw
+
+
+def get_setting(key: str):
+    """
+    Parsed value for `key`, or None if unset.
+    """
+    hit = _cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+
+    gen = _generation
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("SELECT value FROM app_settings WHERE key = %s", (key,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+    value = _parse(row["value"]) if row else None
+
+    with _lock:
+        # skip caching if an invalidation raced with this read
+        if gen == _generation:
+            _cache[key] = (time.monotonic() + SETTINGS_CACHE_TTL, value)
+    return value
+
+
+def set_setting(key: str, value: str):
+    """
+    Upsert a raw (already serialized) value and invalidate it everywhere.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO app_settings(key,value) VALUES(%s,%s) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+            (key, value),
+        )
+        notify(cur, CHANNEL, key)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    invalidate(key)
+
+
+def invalidate(key: str = None):
+    """
+    Drop one key, or everything when key is None/empty.
+    """
+    global _generation
+    with _lock:
+        _generation += 1
+        if key:
+            _cache.pop(key, None)
+        else:
+            _cache.clear()
+
+
+subscribe(CHANNEL, invalidate)
+on_reconnect(invalidate)
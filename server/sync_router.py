@@ -1,63 +1,164 @@
-# sync_router.py
-from fastapi import APIRouter, HTTPException, Depends
-from .models import SyncPushPayload, SyncPullPayload
-from .db import get_conn
-import datetime
-import uuid
-
-router = APIRouter()
-
-# push handler
-@router.post("/sync/push")
-def sync_push(payload: SyncPushPayload, current_user: dict = Depends(lambda: None)):
-    device_id = payload.device_id
-    table = payload.table
-    items = payload.items or []
-    conn = get_conn(); cur = conn.cursor()
-    applied = {}
-    for it in items:
-        local_id = it.local_id
-        data = it.data
-        data['handled_by'] = current_user.get('username') if current_user else None
-        created = data.get('created_at') or datetime.datetime.utcnow().isoformat()
-        keys = list(data.keys())
-        cols = ",".join(keys + ['created_at','remote_token'])
-        placeholders = ",".join(['?'] * (len(keys) + 2))
-        remote_token = str(uuid.uuid4())
-        vals = [data[k] for k in keys] + [created, remote_token]
-        try:
-            cur.execute(f"INSERT INTO {table} ({cols}) VALUES ({placeholders})", vals)
-            rid = cur.lastrowid
-            applied[str(local_id)] = rid
-            # update partners counters if applicable
-            if table == 'pan_records' and data.get('agent_code'):
-                cur.execute("UPDATE d2na_partners SET pan_count = COALESCE(pan_count,0)+1, total_transactions = COALESCE(total_transactions,0)+1, last_update = ? WHERE partner_code = ?", (datetime.datetime.utcnow().isoformat(), data.get('agent_code')))
-            if table == 'kotak_records' and data.get('agent_code'):
-                cur.execute("UPDATE d2na_partners SET kotak_count = COALESCE(kotak_count,0)+1, total_transactions = COALESCE(total_transactions,0)+1, last_update = ? WHERE partner_code = ?", (datetime.datetime.utcnow().isoformat(), data.get('agent_code')))
-        except Exception as e:
-            print("push insert error", e)
-    conn.commit(); conn.close()
-    return {"applied": applied}
-
-@router.post("/sync/pull")
-def sync_pull(payload: SyncPullPayload, current_user: dict = Depends(lambda: None)):
-    since = payload.since or '1970-01-01T00:00:00Z'
-    conn = get_conn(); cur = conn.cursor()
-    res = {}
-    tables = ['d2na_army_logs', 'pan_records', 'kotak_records', 'd2na_partners']
-    for t in tables:
-        try:
-            cur.execute(f"SELECT * FROM {t} WHERE created_at > ? ORDER BY created_at ASC", (since,))
-            rows = cur.fetchall()
-            out = []
-            for r in rows:
-                d = dict(r)
-                remote_id = d.pop('id', None)
-                out.append({'remote_id': remote_id, 'data': d})
-            res[t] = out
-        except Exception:
-            res[t] = []
-    conn.close()
-    return res
-
-
+# sync_router.py
+from fastapi import APIRouter, HTTPException, Depends, Request
+from .models import SyncPushPayload, SyncPullPayload
+from .db import get_conn
+from .partner_counters import record_increment
+from .fastjson import dumps, iter_json_array, stream_json
+from .msgpack_codec import sync_body, negotiated, wants_msgpack, packb, packer, iter_msgpack_array, stream_msgpack
+import datetime
+import re
+import uuid
+
+router = APIRouter()
+
+PUSH_TABLES = ('d2na_army_logs', 'pan_records', 'kotak_records')
+COLUMN_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _ledger_lookup(cur, device_id: str, table: str, local_ids: list) -> dict:
+    cur.execute(
+        "SELECT local_id, remote_id FROM sync_push_ledger WHERE device_id = %s AND table_name = %s AND local_id = ANY(%s)",
+        (device_id, table, local_ids),
+    )
+    return {r['local_id']: r['remote_id'] for r in cur.fetchall()}
+
+
+# push handler
+@router.post("/sync/push")
+def sync_push(
+    request: Request,
+    payload: SyncPushPayload = Depends(sync_body(SyncPushPayload)),
+    current_user: dict = Depends(lambda: None),
+):
+    """
+    Insert pushed desktop records. Idempotent per (device_id, table,
+    local_id): records already pushed are not inserted again and report
+    their existing remote id, so batches can be retried and sent in
+    parallel. Partner counters only count newly inserted records.
+    Response: {"applied": {local_id: remote_id}, "duplicates": [...], "errors": {local_id: msg}}
+    Body and response may be JSON or MessagePack (see msgpack_codec).
+    """
+    device_id = payload.device_id
+    table = payload.table
+    if table not in PUSH_TABLES:
+        raise HTTPException(400, f"table must be one of: {', '.join(PUSH_TABLES)}")
+    items = payload.items or []
+    applied, duplicates, errors = {}, [], {}
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        # retried batches: answer everything already in the ledger with one query
+        known = _ledger_lookup(cur, device_id, table, [str(it.local_id) for it in items])
+        for it in items:
+            local_id = str(it.local_id)
+            if local_id in known:
+                applied[local_id] = known[local_id]
+                duplicates.append(local_id)
+                continue
+            data = dict(it.data)
+            bad = [k for k in data if not COLUMN_RE.match(k)]
+            if bad:
+                errors[local_id] = f"invalid column name(s): {', '.join(bad)}"
+                continue
+            data.pop('id', None)
+            data['handled_by'] = current_user.get('username') if current_user else None
+            created = data.pop('created_at', None) or datetime.datetime.utcnow().isoformat()
+            data['created_at'] = created
+            data['remote_token'] = str(uuid.uuid4())
+            cols = ",".join(data)
+            placeholders = ",".join(['%s'] * len(data))
+            cur.execute("SAVEPOINT push_item")
+            try:
+                # the ledger row is claimed in the same statement as the insert;
+                # a concurrent push of the same record makes the claim come back empty
+                cur.execute(
+                    f"""
+                    WITH ins AS (
+                        INSERT INTO {table} ({cols}) VALUES ({placeholders}) RETURNING id
+                    ), claim AS (
+                        INSERT INTO sync_push_ledger (device_id, table_name, local_id, remote_id)
+                        SELECT %s, %s, %s, id FROM ins
+                        ON CONFLICT DO NOTHING
+                        RETURNING remote_id
+                    )
+                    SELECT (SELECT remote_id FROM claim) AS remote_id
+                    """,
+                    list(data.values()) + [device_id, table, local_id],
+                )
+                rid = cur.fetchone()['remote_id']
+                if rid is None:
+                    cur.execute("ROLLBACK TO SAVEPOINT push_item")
+                    applied[local_id] = _ledger_lookup(cur, device_id, table, [local_id]).get(local_id)
+                    duplicates.append(local_id)
+                    continue
+                # partner counters: append-only delta, merged into d2na_partners by a background job
+                record_increment(cur, table, data.get('agent_code'), created)
+                cur.execute("RELEASE SAVEPOINT push_item")
+                applied[local_id] = rid
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT push_item")
+                print("push insert error", e)
+                errors[local_id] = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close(); conn.close()
+    return negotiated(request, {"applied": applied, "duplicates": duplicates, "errors": errors})
+
+
+PULL_TABLES = ('d2na_army_logs', 'pan_records', 'kotak_records', 'd2na_partners')
+
+
+def _pull_row(r):
+    # RealDictRow is reused as "data"; only the id moves out
+    return {'remote_id': r.pop('id', None), 'data': r}
+
+
+def _iter_pull(since: str, as_msgpack: bool = False):
+    """
+    {"<table>": [{"remote_id", "data"}, ...], ...} streamed table by table
+    through server-side cursors, one snapshot for all tables.
+    MessagePack arrays need their length first, so each table's rows are
+    spooled and counted before the array is sent.
+    """
+    conn = get_conn(readonly=True); cur = conn.cursor()
+    try:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        if as_msgpack:
+            yield packer().pack_map_header(len(PULL_TABLES))
+        for n, t in enumerate(PULL_TABLES):
+            cur.execute("SAVEPOINT pull_table")
+            named = conn.cursor(name=f"pull_{t}")
+            try:
+                named.execute(f"SELECT * FROM {t} WHERE created_at > %s ORDER BY created_at ASC", (since,))
+            except Exception:
+                # table missing on this deployment
+                cur.execute("ROLLBACK TO SAVEPOINT pull_table")
+                yield packb(t) + packb([]) if as_msgpack else (b'{' if n == 0 else b',') + dumps(t) + b':[]'
+                continue
+            if as_msgpack:
+                yield packb(t)
+                yield from iter_msgpack_array(named, _pull_row)
+            else:
+                yield (b'{' if n == 0 else b',') + dumps(t) + b':'
+                yield from iter_json_array(named, _pull_row)
+            named.close()
+            cur.execute("RELEASE SAVEPOINT pull_table")
+        if not as_msgpack:
+            yield b'}'
+    finally:
+        conn.rollback()
+        cur.close(); conn.close()
+
+
+@router.post("/sync/pull")
+def sync_pull(
+    request: Request,
+    payload: SyncPullPayload = Depends(sync_body(SyncPullPayload)),
+    current_user: dict = Depends(lambda: None),
+):
+    since = payload.since or '1970-01-01T00:00:00Z'
+    if wants_msgpack(request):
+        return stream_msgpack(_iter_pull(since, as_msgpack=True))
+    return stream_json(_iter_pull(since))
@@ -0,0 +1,119 @@
+# template_engine.py
+"""
+Message template rendering for OTP and generic WhatsApp templates.
+
+Templates use `{name}` placeholders (`{{` / `}}` for literal braces).
+Each stored template version is parsed and validated once into a
+CompiledTemplate of literal/placeholder parts; renders after that only
+join the parts with the values.
+Attribute/index access, conversions and format specs are rejected, so
+stored templates cannot reach into the objects passed to them.
+"""
+
+import hashlib
+import string
+from functools import lru_cache
+
+from .settings_cache import get_setting
+
+DEFAULT_OTP_TEMPLATE_EN = "Dear {username} ji,\n\nYour OTP is: {otp}\n\nValid for {minutes} minutes.\n— EasyAdvisor™"
+DEFAULT_OTP_TEMPLATE_HI = "प्रिय {username} जी,\n\nआपका OTP है: {otp}\n\n{minutes} मिनट के लिए मान्य।\n— EasyAdvisor™"
+
+OTP_PLACEHOLDERS = ("username", "otp", "minutes")
+
+_formatter = string.Formatter()
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class CompiledTemplate:
+    __slots__ = ("key", "version", "text", "placeholders", "_parts")
+
+    def __init__(self, key: str, version: str, text: str, placeholders: tuple, parts: tuple):
+        self.key = key
+        self.version = version
+        self.text = text
+        self.placeholders = placeholders
+        self._parts = parts  # ((literal, placeholder name or None), ...), braces already unescaped
+
+    def render(self, values: dict) -> str:
+        out = []
+        try:
+            for literal, field in self._parts:
+                out.append(literal)
+                if field is not None:
+                    out.append(str(values[field]))
+        except KeyError as e:
+            raise TemplateError(f"missing value for placeholder {e.args[0]!r} in template {self.key!r}")
+        return "".join(out)
+
+
+def compile_template(text: str, key: str = "", version: str = "", allowed=None, required=()) -> CompiledTemplate:
+    """
+    Parse and validate template text. `allowed` restricts placeholder
+    names; every name in `required` must appear.
+    """
+    if not isinstance(text, str):
+        raise TemplateError("template must be a string")
+    placeholders = []
+    try:
+        parsed = list(_formatter.parse(text))
+    except ValueError as e:
+        raise TemplateError(f"malformed template: {e}")
+    for _, field, spec, conversion in parsed:
+        if field is None:
+            continue
+        if not field.isidentifier():
+            raise TemplateError(f"invalid placeholder {{{field}}}: use plain names like {{username}}")
+        if spec or conversion:
+            raise TemplateError(f"placeholder {{{field}}} must not use format specs or conversions")
+        if allowed is not None and field not in allowed:
+            raise TemplateError(f"unknown placeholder {{{field}}}; allowed: {', '.join(allowed)}")
+        if field not in placeholders:
+            placeholders.append(field)
+    missing = [r for r in required if r not in placeholders]
+    if missing:
+        raise TemplateError(f"template must contain {', '.join('{' + m + '}' for m in missing)}")
+    parts = tuple((literal, field) for literal, field, _, _ in parsed)
+    return CompiledTemplate(key, version, text, tuple(placeholders), parts)
+
+
+@lru_cache(maxsize=512)
+def _compiled(key: str, version: str, text: str, otp: bool) -> CompiledTemplate:
+    if otp:
+        return compile_template(text, key, version, allowed=OTP_PLACEHOLDERS, required=("otp",))
+    return compile_template(text, key, version)
+
+
+def text_version(text: str) -> str:
+    # raw OTP templates carry no version; key the cache on their content
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def get_otp_renderer(lang: str = "en") -> CompiledTemplate:
+    key = f"otp_template_whatsapp_{lang}"
+    text = get_setting(key)
+    if text and isinstance(text, str):
+        try:
+            return _compiled(key, text_version(text), text, True)
+        except TemplateError as e:
+            # saved before validation existed; fall back rather than fail the OTP
+            print(f"stored {key} is invalid, using default:", e)
+    text = DEFAULT_OTP_TEMPLATE_EN if lang.startswith("en") else DEFAULT_OTP_TEMPLATE_HI
+    return _compiled(f"default_{key}", text_version(text), text, True)
+
+
+def get_generic_renderer(key: str):
+    """
+    Renderer for a versioned template_generic_{key}, or None if not stored.
+    """
+    v = get_setting(f"template_generic_{key}")
+    if not isinstance(v, dict) or not v.get("template"):
+        return None
+    return _compiled(key, v.get("version", "1.0"), v["template"], False)
+
+
+def render_otp_message(lang: str, **values) -> str:
+    return get_otp_renderer(lang or "en").render(values)
@@ -0,0 +1,110 @@
+# upload_router.py
+"""
+Upload store endpoints: resumable chunked uploads and downloads.
+- POST /sessions                     : start a session {filename, size, sha256, chunk_size?}
+- PUT  /sessions/{id}?offset=N       : raw chunk body, X-Chunk-SHA256 header
+- GET  /sessions/{id}                : received bytes + missing chunk offsets
+- POST /sessions/{id}/complete       : verify whole file, returns file_id like /upload_file
+- GET  /files/{file_id}              : download an upload (Range, ETag, If-None-Match)
+- GET  /sweeper                      : last expiry sweep report (ADMIN)
+"""
+
+import os
+from fastapi import APIRouter, HTTPException, Depends, Request, Header
+from starlette.concurrency import run_in_threadpool
+from .dependencies import get_current_user, require_role
+from .models import UploadSessionInit
+from .uploads import upload_abspath
+from .uploads.store import get_upload
+from .uploads.download import build_file_response
+from .uploads.sessions import (
+    init_session,
+    put_chunk,
+    session_status,
+    complete_session,
+    session_chunk_size,
+    UploadSessionError,
+    MAX_CHUNK_SIZE,
+)
+from .uploads import sweeper
+
+router = APIRouter()
+
+
+def _call(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except UploadSessionError as e:
+        raise HTTPException(e.status_code, e.detail)
+
+
+def _owner(current_user: dict) -> str:
+    owner = current_user.get("sub") or current_user.get("username")
+    if not owner:
+        raise HTTPException(401, "Token has no subject")
+    return owner
+
+
+@router.post("/sessions")
+def start_session(payload: UploadSessionInit, current_user: dict = Depends(get_current_user)):
+    return _call(init_session, payload.filename, payload.size, payload.sha256, _owner(current_user), payload.chunk_size)
+
+
+@router.put("/sessions/{session_id}")
+async def upload_chunk(
+    session_id: str,
+    offset: int,
+    request: Request,
+    x_chunk_sha256: str = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    owner = _owner(current_user)
+    limit = min(await run_in_threadpool(_call, session_chunk_size, session_id, owner), MAX_CHUNK_SIZE)
+    # Content-Length is only a hint (absent with chunked encoding); count what actually arrives
+    if int(request.headers.get("content-length") or 0) > limit:
+        raise HTTPException(413, f"Chunk too large. Max {limit} bytes.")
+    parts, received = [], 0
+    async for part in request.stream():
+        received += len(part)
+        if received > limit:
+            raise HTTPException(413, f"Chunk too large. Max {limit} bytes.")
+        parts.append(part)
+    data = b"".join(parts)
+    return await run_in_threadpool(_call, put_chunk, session_id, offset, data, x_chunk_sha256, owner)
+
+
+@router.get("/sessions/{session_id}")
+def get_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    return _call(session_status, session_id, _owner(current_user))
+
+
+@router.post("/sessions/{session_id}/complete")
+def finish_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    row = _call(complete_session, session_id, _owner(current_user))
+    return {
+        "ok": True,
+        "file_id": row["file_id"],
+        "file_path": upload_abspath(row["storage_path"]),
+        "sha256": row["sha256"],
+        "deduplicated": row["deduplicated"],
+    }
+
+
+@router.api_route("/files/{file_id}", methods=["GET", "HEAD"])
+def download_file(file_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    Serve an uploaded file. Clients should keep the ETag and send
+    If-None-Match; partial fetches use a single `Range: bytes=a-b`.
+    """
+    row = get_upload(file_id)
+    if not row:
+        raise HTTPException(404, "file not found on server")
+    path = upload_abspath(row["storage_path"])
+    if not os.path.exists(path):
+        raise HTTPException(404, "file not found on server")
+    return build_file_response(request, path, row)
+
+
+@router.get("/sweeper")
+def sweeper_status(current_user: dict = Depends(require_role("ADMIN"))):
+    return {"retention_days": sweeper.UPLOAD_RETENTION_DAYS, "last_report": sweeper.last_report}
@@ -1,45 +1,53 @@
-# server/uploads/__init__.py
-"""
-Uploads package - ensures uploads directory exists and provides simple helpers.
-"""
-
-import os
-import datetime
-
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-UPLOADS_DIR = os.path.join(BASE_DIR)  # this file is inside server/uploads so BASE_DIR is server/uploads
-
-# If for some reason BASE_DIR is wrong, fallback to parent/server/uploads
-if not os.path.exists(UPLOADS_DIR):
-    # attempt create
-    try:
-        os.makedirs(UPLOADS_DIR, exist_ok=True)
-    except Exception:
-        UPLOADS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
-        os.makedirs(UPLOADS_DIR, exist_ok=True)
-
-def ensure_uploads_dir():
-    os.makedirs(UPLOADS_DIR, exist_ok=True)
-    return UPLOADS_DIR
-
-def make_upload_filename(orig_name: str):
-    ts = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    safe = orig_name.replace(" ", "_")
-    return f"{ts}_{safe}"
-
-def cleanup_older_than(days: int = 30):
-    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
-    removed = []
-    for fn in os.listdir(UPLOADS_DIR):
-        path = os.path.join(UPLOADS_DIR, fn)
-        try:
-            mtime = datetime.datetime.utcfromtimestamp(os.path.getmtime(path))
-            if mtime < cutoff:
-                os.remove(path)
-                removed.append(fn)
-        except Exception:
-            pass
-    return removed
-
-# ensure folder exists on import
-ensure_uploads_dir()
+# server/uploads/__init__.py
+"""
+Uploads package - ensures uploads directory exists and provides simple helpers.
+"""
+
+import os
+import datetime
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+UPLOADS_DIR = os.path.join(BASE_DIR)  # this file is inside server/uploads so BASE_DIR is server/uploads
+
+# If for some reason BASE_DIR is wrong, fallback to parent/server/uploads
+if not os.path.exists(UPLOADS_DIR):
+    # attempt create
+    try:
+        os.makedirs(UPLOADS_DIR, exist_ok=True)
+    except Exception:
+        UPLOADS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
+        os.makedirs(UPLOADS_DIR, exist_ok=True)
+
+def ensure_uploads_dir():
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    return UPLOADS_DIR
+
+def make_upload_filename(orig_name: str):
+    ts = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    safe = orig_name.replace(" ", "_")
+    return f"{ts}_{safe}"
+
+def blob_relpath(sha256: str, when: datetime.datetime = None) -> str:
+    """
+    Relative storage path for a content-addressed blob.
+    Sharded by upload date, then by hash prefix, so no directory grows
+    unbounded and old blobs live apart from new ones.
+    """
+    when = when or datetime.datetime.utcnow()
+    return os.path.join("blobs", when.strftime("%Y"), when.strftime("%m"), when.strftime("%d"), sha256[:2], sha256)
+
+def upload_abspath(relpath: str) -> str:
+    return os.path.join(UPLOADS_DIR, relpath)
+
+def cleanup_older_than(days: int = 30):
+    """
+    Remove uploads not referenced for `days` days.
+    Kept for callers of the old flat-directory sweep; the work is done by
+    uploads.sweeper in bounded batches.
+    """
+    from .sweeper import sweep_expired_uploads, sweep_legacy_files
+    report = sweep_expired_uploads(days)
+    return report["file_ids"] + sweep_legacy_files(days)
+
+# ensure folder exists on import
+ensure_uploads_dir()
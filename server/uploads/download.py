@@ -0,0 +1,142 @@
+# server/uploads/download.py
+"""
+File responses for the upload store: strong ETags (the blob sha256),
+If-None-Match / 304, single-range Range requests and zero-copy sends.
+
+When the ASGI server offers the `http.response.zerocopysend` extension
+the file descriptor is handed to it (sendfile); otherwise the file is
+streamed in chunks from a worker thread.
+"""
+
+import os
+import mimetypes
+import unicodedata
+from urllib.parse import quote
+
+import anyio
+from starlette.responses import Response
+
+from ..utils import etag_matches
+
+CHUNK_SIZE = 256 * 1024
+CACHE_CONTROL = "private, max-age=86400"
+
+
+def etag_for(sha256: str) -> str:
+    return f'"{sha256}"'
+
+
+def content_disposition(name: str, disposition: str = "inline") -> str:
+    """
+    Content-Disposition with an ASCII `filename` fallback and the full
+    name as RFC 5987 `filename*`; header values must be latin-1.
+    """
+    name = "".join(c for c in os.path.basename(name) if c.isprintable())
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    ascii_name = ascii_name.replace('"', "").replace("\\", "").strip()
+    if not ascii_name or ascii_name.startswith("."):
+        ext = os.path.splitext(name)[1]
+        ascii_name = "download" + (ext if ext.isascii() else "")
+    value = f'{disposition}; filename="{ascii_name}"'
+    if name and ascii_name != name:
+        value += f"; filename*=UTF-8''{quote(name, safe='')}"
+    return value
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a single `bytes=` range into an inclusive (start, end).
+    Returns None when the header should be ignored (absent, malformed or
+    multi-range) and raises ValueError when it is unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, sep, last = header[len("bytes="):].strip().partition("-")
+    if not sep or not (first or last) or not (first + last).isdigit():
+        return None
+    if size == 0:
+        raise ValueError("range not satisfiable")
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("range not satisfiable")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start > end:
+        return None
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    def __init__(self, path: str, start: int, end: int, status_code: int = 200,
+                 headers: dict = None, media_type: str = None):
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(self.count)
+        self.headers["accept-ranges"] = "bytes"
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            return
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = self.count
+            while remaining:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining:
+            # file shrank underneath us; close the response anyway
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def build_file_response(request, path: str, row: dict) -> Response:
+    """
+    Response for one upload_files row, honouring If-None-Match, Range and If-Range.
+    """
+    size = os.path.getsize(path)
+    etag = etag_for(row["sha256"])
+    headers = {"etag": etag, "cache-control": CACHE_CONTROL}
+    name = row.get("original_name") or row["file_id"]
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    headers["content-disposition"] = content_disposition(name)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        try:
+            rng = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+        if rng:
+            start, end = rng
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            return RangeFileResponse(path, start, end, 206, headers, media_type)
+
+    return RangeFileResponse(path, 0, size - 1, 200, headers, media_type)
@@ -0,0 +1,243 @@
+# server/uploads/sessions.py
+"""
+Resumable chunked upload sessions.
+
+init     -> creates a sparse .part file of the declared size
+put      -> writes one chunk at its offset (pwrite), verified by sha256
+status   -> which chunk offsets are still missing
+complete -> verifies the whole file against the declared sha256 and
+            hands it to the content-addressed store
+"""
+
+import os
+import re
+import uuid
+import hashlib
+import datetime
+
+from ..db import get_conn
+from . import UPLOADS_DIR
+from .store import hash_stream, store_local_file
+
+SESSIONS_DIR = os.path.join(UPLOADS_DIR, "sessions")
+
+DEFAULT_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(4 * 1024 * 1024)))
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+SESSION_MAX_MB = int(os.environ.get("UPLOAD_SESSION_MAX_MB", "2048"))
+SESSION_TTL_HOURS = int(os.environ.get("UPLOAD_SESSION_TTL_HOURS", "24"))
+SHA256_RE = re.compile(r"^[0-9a-fA-F]{64}$")
+
+
+class UploadSessionError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _part_path(session_id: str) -> str:
+    return os.path.join(SESSIONS_DIR, f"{session_id}.part")
+
+
+def _load_session(cur, session_id: str, username: str, for_update: bool = False):
+    cur.execute(
+        "SELECT * FROM upload_sessions WHERE session_id = %s" + (" FOR UPDATE" if for_update else ""),
+        (session_id,),
+    )
+    sess = cur.fetchone()
+    if not sess:
+        raise UploadSessionError(404, "upload session not found")
+    # sessions without a recorded owner (created before owners were set) are nobody's
+    if sess["uploaded_by"] is None or sess["uploaded_by"] != username:
+        raise UploadSessionError(403, "upload session belongs to another user")
+    return sess
+
+
+def _missing_offsets(sess, received):
+    expected = range(0, sess["total_size"], sess["chunk_size"])
+    return [o for o in expected if o not in received]
+
+
+def init_session(filename: str, total_size: int, sha256: str, username: str, chunk_size: int = None) -> dict:
+    """
+    Start a session. The .part file is truncated to total_size so chunks
+    can land in any order without the filesystem allocating the gaps.
+    """
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if total_size <= 0 or total_size > SESSION_MAX_MB * 1024 * 1024:
+        raise UploadSessionError(413, f"File size must be between 1 byte and {SESSION_MAX_MB} MB")
+    if chunk_size <= 0 or chunk_size > MAX_CHUNK_SIZE:
+        raise UploadSessionError(400, f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}")
+    if not sha256 or not SHA256_RE.match(sha256):
+        raise UploadSessionError(400, "sha256 of the whole file is required (64 hex digits)")
+
+    session_id = uuid.uuid4().hex
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    with open(_part_path(session_id), "wb") as f:
+        f.truncate(total_size)
+
+    now = datetime.datetime.utcnow()
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            INSERT INTO upload_sessions (session_id, filename, total_size, sha256, chunk_size, uploaded_by, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (session_id, filename, total_size, sha256.lower(), chunk_size, username, now, now),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        os.remove(_part_path(session_id))
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return {"session_id": session_id, "chunk_size": chunk_size, "total_size": total_size}
+
+
+def session_chunk_size(session_id: str, username: str) -> int:
+    """
+    Chunk size of the caller's session; lets the router cap a chunk body
+    while it is still being received.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        return _load_session(cur, session_id, username)["chunk_size"]
+    finally:
+        cur.close()
+        conn.close()
+
+
+def put_chunk(session_id: str, offset: int, data: bytes, chunk_sha256: str, username: str) -> dict:
+    """
+    Write one chunk at `offset`. Offsets must be chunk-aligned and every
+    chunk except the last must be exactly chunk_size bytes. Re-sending a
+    chunk that was already stored is accepted and overwrites it.
+    """
+    if not chunk_sha256 or hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+        raise UploadSessionError(422, "chunk checksum mismatch")
+
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        sess = _load_session(cur, session_id, username)
+        if sess["completed_file_id"]:
+            raise UploadSessionError(409, "upload session already completed")
+        size, chunk_size = sess["total_size"], sess["chunk_size"]
+        if offset < 0 or offset >= size or offset % chunk_size:
+            raise UploadSessionError(416, "offset must be chunk-aligned and inside the file")
+        if len(data) != min(chunk_size, size - offset):
+            raise UploadSessionError(400, f"chunk at offset {offset} must be {min(chunk_size, size - offset)} bytes")
+
+        fd = os.open(_part_path(session_id), os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+
+        now = datetime.datetime.utcnow()
+        cur.execute(
+            """
+            INSERT INTO upload_session_chunks (session_id, chunk_offset, length, sha256)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (session_id, chunk_offset) DO UPDATE SET length = EXCLUDED.length, sha256 = EXCLUDED.sha256
+            """,
+            (session_id, offset, len(data), chunk_sha256.lower()),
+        )
+        cur.execute("UPDATE upload_sessions SET updated_at = %s WHERE session_id = %s", (now, session_id))
+        conn.commit()
+        return {"session_id": session_id, "offset": offset, "length": len(data)}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def session_status(session_id: str, username: str) -> dict:
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        sess = _load_session(cur, session_id, username)
+        cur.execute("SELECT chunk_offset, length FROM upload_session_chunks WHERE session_id = %s", (session_id,))
+        chunks = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    received = {c["chunk_offset"] for c in chunks}
+    return {
+        "session_id": session_id,
+        "filename": sess["filename"],
+        "total_size": sess["total_size"],
+        "chunk_size": sess["chunk_size"],
+        "received_bytes": sum(c["length"] for c in chunks),
+        "missing_offsets": _missing_offsets(sess, received),
+        "completed_file_id": sess["completed_file_id"],
+    }
+
+
+def complete_session(session_id: str, username: str) -> dict:
+    """
+    Verify every chunk arrived and the assembled file hashes to the
+    declared sha256, then move it into the upload store. The session row
+    stays locked throughout, so concurrent completes run one at a time
+    and the later ones get 409. Completed sessions are kept (marked with
+    their file_id) until gc_stale_sessions removes them.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        sess = _load_session(cur, session_id, username, for_update=True)
+        if sess["completed_file_id"]:
+            raise UploadSessionError(409, "upload session already completed")
+        cur.execute("SELECT chunk_offset FROM upload_session_chunks WHERE session_id = %s", (session_id,))
+        missing = _missing_offsets(sess, {c["chunk_offset"] for c in cur.fetchall()})
+        if missing:
+            raise UploadSessionError(409, f"{len(missing)} chunk(s) still missing")
+
+        path = _part_path(session_id)
+        try:
+            with open(path, "rb") as f:
+                sha, size = hash_stream(f)
+        except FileNotFoundError:
+            raise UploadSessionError(409, "upload session has no assembled file")
+        if sha != sess["sha256"] or size != sess["total_size"]:
+            raise UploadSessionError(422, "assembled file does not match declared sha256")
+
+        row = store_local_file(path, sess["filename"], username, sha256=sha)
+        cur.execute(
+            "UPDATE upload_sessions SET completed_file_id = %s, updated_at = %s WHERE session_id = %s",
+            (row["file_id"], datetime.datetime.utcnow(), session_id),
+        )
+        cur.execute("DELETE FROM upload_session_chunks WHERE session_id = %s", (session_id,))
+        conn.commit()
+        return row
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def gc_stale_sessions(max_age_hours: int = SESSION_TTL_HOURS) -> list:
+    """
+    Delete sessions (and their .part files) untouched for max_age_hours.
+    Returns the removed session ids.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=max_age_hours)
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM upload_sessions WHERE updated_at < %s RETURNING session_id", (cutoff,))
+        removed = [r["session_id"] for r in cur.fetchall()]
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    for sid in removed:
+        try:
+            os.remove(_part_path(sid))
+        except FileNotFoundError:
+            pass
+    return removed
+
@@ -0,0 +1,204 @@
+# server/uploads/store.py
+"""
+Content-addressed upload store.
+
+Blobs are stored once per sha256 under uploads/blobs/<yyyy>/<mm>/<dd>/<aa>/<sha256>.
+The upload_files table maps opaque file_ids to blobs and keeps a
+reference count, so re-uploading an identical file returns the existing
+file_id instead of writing another copy.
+"""
+
+import os
+import uuid
+import hashlib
+import datetime
+
+from ..db import get_conn
+from . import UPLOADS_DIR, blob_relpath, upload_abspath
+
+CHUNK_SIZE = 1024 * 1024
+TMP_DIR = os.path.join(UPLOADS_DIR, "tmp")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def hash_stream(fileobj, max_bytes: int = None):
+    """
+    Hash a file object in chunks. Returns (sha256 hex, size).
+    Raises UploadTooLarge once more than max_bytes have been read.
+    """
+    h = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise UploadTooLarge(size)
+        h.update(chunk)
+    return h.hexdigest(), size
+
+
+def _write_blob(fileobj, relpath: str):
+    """
+    Copy fileobj into the blob path via a temp file + rename, so a blob
+    path never holds a partially written file.
+    """
+    dest = upload_abspath(relpath)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.makedirs(TMP_DIR, exist_ok=True)
+    tmp = os.path.join(TMP_DIR, uuid.uuid4().hex)
+    fileobj.seek(0)
+    with open(tmp, "wb") as out:
+        while True:
+            chunk = fileobj.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+    os.replace(tmp, dest)
+
+
+def store_upload(fileobj, original_name: str = "", uploaded_by: str = None, max_bytes: int = None) -> dict:
+    """
+    Store the contents of fileobj (seekable) and return its metadata row.
+    The blob is only written when its hash is not already known.
+    """
+    sha, size = hash_stream(fileobj, max_bytes)
+    return _register(sha, size, original_name, uploaded_by, lambda relpath: _write_blob(fileobj, relpath))
+
+
+def store_local_file(path: str, original_name: str = "", uploaded_by: str = None, sha256: str = None) -> dict:
+    """
+    Store a file that already sits on the uploads filesystem (e.g. an
+    assembled chunked upload). The file is renamed into place rather than
+    copied, and removed if its content is already stored.
+    """
+    size = os.path.getsize(path)
+    if not sha256:
+        with open(path, "rb") as f:
+            sha256, size = hash_stream(f)
+
+    def place(relpath):
+        dest = upload_abspath(relpath)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(path, dest)
+
+    row = _register(sha256, size, original_name, uploaded_by, place)
+    if os.path.exists(path):
+        os.remove(path)
+    return row
+
+
+def _register(sha: str, size: int, original_name: str, uploaded_by: str, place_blob) -> dict:
+    """
+    Record one reference to blob `sha`, calling place_blob(relpath) only
+    when the blob is not on disk yet.
+    """
+    ext = os.path.splitext(original_name or "")[1].lower()
+    now = datetime.datetime.utcnow()
+
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            UPDATE upload_files SET ref_count = ref_count + 1, last_ref_at = %s
+            WHERE sha256 = %s
+            RETURNING file_id, sha256, size, storage_path
+            """,
+            (now, sha),
+        )
+        row = cur.fetchone()
+        if row:
+            # blob may have been removed by hand; restore it from this upload
+            if not os.path.exists(upload_abspath(row["storage_path"])):
+                place_blob(row["storage_path"])
+            conn.commit()
+            return {**dict(row), "deduplicated": True}
+
+        relpath = blob_relpath(sha, now)
+        if not os.path.exists(upload_abspath(relpath)):
+            place_blob(relpath)
+        cur.execute(
+            """
+            INSERT INTO upload_files (file_id, sha256, size, ext, storage_path, original_name, uploaded_by, created_at, last_ref_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (sha256) DO UPDATE
+                SET ref_count = upload_files.ref_count + 1, last_ref_at = EXCLUDED.last_ref_at
+            RETURNING file_id, sha256, size, storage_path, (xmax = 0) AS inserted
+            """,
+            (f"{uuid.uuid4().hex}{ext}", sha, size, ext, relpath, original_name, uploaded_by, now, now),
+        )
+        row = dict(cur.fetchone())
+        conn.commit()
+        row["deduplicated"] = not row.pop("inserted")
+        return row
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def get_upload(file_id: str):
+    """
+    Metadata row for a file_id, or None.
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute("SELECT * FROM upload_files WHERE file_id = %s", (file_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+    finally:
+        cur.close()
+        conn.close()
+
+
+def resolve_upload_path(file_id: str):
+    """
+    Absolute blob path for a file_id, or None if unknown or missing on disk.
+    """
+    row = get_upload(file_id)
+    if not row:
+        return None
+    path = upload_abspath(row["storage_path"])
+    return path if os.path.exists(path) else None
+
+
+def release_upload(file_id: str) -> bool:
+    """
+    Drop one reference to file_id. The row and blob are deleted when the
+    last reference goes away. Returns True if the blob was removed.
+    No request path releases references today; expiry is by retention
+    (see sweeper.py).
+    """
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE upload_files SET ref_count = ref_count - 1 WHERE file_id = %s RETURNING ref_count, storage_path",
+            (file_id,),
+        )
+        row = cur.fetchone()
+        if not row:
+            conn.commit()
+            return False
+        last_ref = row["ref_count"] <= 0
+        if last_ref:
+            cur.execute("DELETE FROM upload_files WHERE file_id = %s", (file_id,))
+        conn.commit()
+        if not last_ref:
+            return False
+        try:
+            os.remove(upload_abspath(row["storage_path"]))
+        except FileNotFoundError:
+            pass
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
@@ -0,0 +1,133 @@
+# server/uploads/sweeper.py
+"""
+Expiry sweeper for the upload store.
+
+Retention policy: an upload is kept for UPLOAD_RETENTION_DAYS after its
+last reference, i.e. the last time that content was uploaded (a dedup
+hit refreshes last_ref_at). ref_count is not consulted: nothing releases
+references (sent messages only log a path), so it only ever grows. This
+is the same age-based rule the legacy flat directory has always had.
+
+Expired rows are found through the last_ref_at index and deleted in
+bounded batches, so a sweep never holds long locks or walks the upload
+directories.
+"""
+
+import os
+import datetime
+
+from ..db import get_conn
+from . import UPLOADS_DIR, upload_abspath
+
+UPLOAD_RETENTION_DAYS = int(os.environ.get("UPLOAD_RETENTION_DAYS", "30"))
+SWEEP_BATCH_SIZE = int(os.environ.get("UPLOAD_SWEEP_BATCH_SIZE", "500"))
+SWEEP_MAX_BATCHES = int(os.environ.get("UPLOAD_SWEEP_MAX_BATCHES", "20"))
+SWEEP_INTERVAL_SECONDS = int(os.environ.get("UPLOAD_SWEEP_INTERVAL_MINUTES", "60")) * 60
+
+last_report = None
+_legacy_scan = None  # os.scandir iterator resumed by the next legacy sweep
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return
+    # prune now-empty shard directories up to blobs/
+    parent = os.path.dirname(path)
+    stop = os.path.join(UPLOADS_DIR, "blobs")
+    while parent.startswith(stop) and parent != stop:
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+
+def sweep_expired_uploads(days: int = UPLOAD_RETENTION_DAYS, batch_size: int = SWEEP_BATCH_SIZE,
+                          max_batches: int = SWEEP_MAX_BATCHES) -> dict:
+    """
+    Delete uploads last referenced more than `days` days ago (see the
+    retention policy above), at most batch_size * max_batches per call.
+    Returns a report of what was removed.
+    """
+    global last_report
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    removed, total_bytes = [], 0
+
+    conn = get_conn(); cur = conn.cursor()
+    try:
+        for _ in range(max_batches):
+            cur.execute(
+                """
+                DELETE FROM upload_files WHERE file_id IN (
+                    SELECT file_id FROM upload_files
+                    WHERE last_ref_at < %s
+                    ORDER BY last_ref_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING file_id, storage_path, size
+                """,
+                (cutoff, batch_size),
+            )
+            rows = cur.fetchall()
+            conn.commit()
+            for r in rows:
+                _remove_file(upload_abspath(r["storage_path"]))
+                removed.append(r["file_id"])
+                total_bytes += r["size"] or 0
+            if len(rows) < batch_size:
+                break
+    finally:
+        cur.close()
+        conn.close()
+
+    last_report = {
+        "ran_at": datetime.datetime.utcnow().isoformat(),
+        "cutoff": cutoff.isoformat(),
+        "removed": len(removed),
+        "bytes": total_bytes,
+        "file_ids": removed[:100],
+    }
+    return last_report
+
+
+def sweep_legacy_files(days: int = UPLOAD_RETENTION_DAYS, limit: int = SWEEP_BATCH_SIZE) -> list:
+    """
+    Remove old files from the legacy flat uploads directory (written
+    before the upload store). Visits at most `limit` directory entries
+    per call; the next call continues where this one stopped and a new
+    pass starts once the directory is exhausted.
+    """
+    global _legacy_scan
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=days)).timestamp()
+    removed = []
+    if _legacy_scan is None:
+        _legacy_scan = os.scandir(UPLOADS_DIR)
+    for _ in range(limit):
+        entry = next(_legacy_scan, None)
+        if entry is None:
+            _legacy_scan.close()
+            _legacy_scan = None
+            break
+        if not entry.is_file(follow_symlinks=False) or entry.name.endswith((".py", ".bak")):
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                os.remove(entry.path)
+                removed.append(entry.name)
+        except OSError:
+            pass
+    return removed
+
+
+def sweep_uploads() -> dict:
+    """
+    Scheduled entry point: sweep the store, then a bounded slice of the
+    legacy flat directory.
+    """
+    report = sweep_expired_uploads()
+    report["legacy_removed"] = len(sweep_legacy_files())
+    report["rows"] = report["removed"] + report["legacy_removed"]
+    return report
@@ -1,49 +1,130 @@
-# server/version_admin_router.py
-"""
-Admin API to update Fingov Pro Desktop version_info.json
-No server redeploy needed.
-"""
-
-from fastapi import APIRouter, HTTPException
-import json
-import os
-
-router = APIRouter(prefix="/admin", tags=["Admin"])
-
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-VERSION_FILE = os.path.join(BASE_DIR, "version_info.json")
-
-# Simple admin password protection (change it!)
-ADMIN_PASSWORD = "Faqueeha25@#"
-
-
-@router.post("/update_version")
-def update_version(payload: dict, password: str):
-    """
-    payload must include:
-    - latest_version
-    - download_url
-    - mandatory
-    - release_notes
-    - sha256
-    """
-
-    if password != ADMIN_PASSWORD:
-        raise HTTPException(status_code=401, detail="Invalid admin password")
-
-    required_fields = [
-        "latest_version",
-        "download_url",
-        "mandatory",
-        "release_notes",
-        "sha256"
-    ]
-
-    for f in required_fields:
-        if f not in payload:
-            raise HTTPException(status_code=400, detail=f"Missing field: {f}")
-
-    with open(VERSION_FILE, "w") as f:
-        json.dump(payload, f, indent=4)
-
-    return {"status": "ok", "message": "Version info updated successfully"}
+# server/version_admin_router.py
+"""
+Admin API to update Fingov Pro Desktop version_info.json
+No server redeploy needed.
+
+Desktops poll GET /admin/version_info; it is served from memory with a
+strong ETag so an unchanged manifest costs a 304 and no disk read.
+"""
+
+from fastapi import APIRouter, HTTPException, Request, Response
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from . import audit
+from .utils import etag_matches
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VERSION_FILE = os.path.join(BASE_DIR, "version_info.json")
+# shipped manifest, used until an admin publishes version_info.json
+FALLBACK_VERSION_FILE = os.path.join(BASE_DIR, "update", "latest.json")
+
+VERSION_CACHE_CONTROL = "public, max-age=60, must-revalidate"
+# how often a worker stats the file to pick up writes made by other workers
+VERSION_RECHECK_SECONDS = 2.0
+
+# (body, etag, stamp, checked_at); replaced whole, never mutated, so a
+# reader always gets a body with its own ETag
+_manifest = None
+_manifest_lock = threading.Lock()
+
+# Simple admin password protection (change it!)
+ADMIN_PASSWORD = "Faqueeha25@#"
+
+
+@router.post("/update_version")
+def update_version(payload: dict, password: str, request: Request):
+    """
+    payload must include:
+    - latest_version
+    - download_url
+    - mandatory
+    - release_notes
+    - sha256
+    """
+
+    if password != ADMIN_PASSWORD:
+        raise HTTPException(status_code=401, detail="Invalid admin password")
+
+    required_fields = [
+        "latest_version",
+        "download_url",
+        "mandatory",
+        "release_notes",
+        "sha256"
+    ]
+
+    for f in required_fields:
+        if f not in payload:
+            raise HTTPException(status_code=400, detail=f"Missing field: {f}")
+
+    _write_atomic(payload)
+    _load_manifest(force=True)
+    # password-protected rather than token-protected, so there is no user to name
+    audit.log_admin_action({"sub": "version-admin"}, request, "update_version", str(payload["latest_version"]),
+                            {"mandatory": payload["mandatory"], "sha256": payload["sha256"]})
+
+    return {"status": "ok", "message": "Version info updated successfully"}
+
+
+def _write_atomic(payload: dict):
+    """
+    Write to a temp file in the same directory, fsync, then rename over
+    VERSION_FILE so readers see either the old or the new manifest.
+    """
+    fd, tmp = tempfile.mkstemp(dir=BASE_DIR, prefix=".version_info.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(payload, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, VERSION_FILE)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _load_manifest(force: bool = False):
+    global _manifest
+    now = time.monotonic()
+    m = _manifest
+    if not force and m is not None and now - m[3] < VERSION_RECHECK_SECONDS:
+        return m
+    with _manifest_lock:
+        path = VERSION_FILE if os.path.exists(VERSION_FILE) else FALLBACK_VERSION_FILE
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="No version info published")
+        stamp = (path, st.st_mtime_ns, st.st_size)
+        m = _manifest
+        if force or m is None or stamp != m[2]:
+            with open(path, "rb") as f:
+                body = f.read()
+            m = (body, '"%s"' % hashlib.sha256(body).hexdigest()[:32], stamp, now)
+        else:
+            m = (m[0], m[1], stamp, now)
+        _manifest = m
+    return m
+
+
+@router.get("/version_info")
+def get_version_info(request: Request):
+    """
+    Current desktop version manifest. Send If-None-Match with the last
+    ETag to get a bodyless 304 when nothing changed.
+    """
+    body, etag, _, _ = _load_manifest()
+    headers = {"ETag": etag, "Cache-Control": VERSION_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)